@@ -5,13 +5,9 @@ implemented sensors are APK (general periodic check) insurance status
 and recall information
 """
 
-from functools import partial
 import logging
 import voluptuous as vol
-from datetime import (
-    datetime,
-    timedelta,
-)
+from datetime import timedelta
 
 from homeassistant.const import (
     CONF_BINARY_SENSORS,
@@ -20,41 +16,60 @@ from homeassistant.const import (
     CONF_SENSORS,
 )
 import homeassistant.helpers.config_validation as cv
+from homeassistant.core import callback
 from homeassistant.config_entries import SOURCE_IMPORT
 from homeassistant.exceptions import PlatformNotReady
-from homeassistant.helpers.discovery import async_load_platform
 from homeassistant.helpers.dispatcher import async_dispatcher_send
 from homeassistant.helpers.entity import Entity
-from homeassistant.helpers.event import async_track_time_interval
-from homeassistant.util import Throttle
+from homeassistant.helpers.event import async_track_point_in_time
+import homeassistant.util.dt as dt_util
 
 from .const import (
     BINARY_SENSOR_DEFAULTS,
     BINARY_SENSOR_TYPES,
+    CONF_ADAPTIVE,
     CONF_BINARY_SENSOR,
     CONF_PLATE,
     CONF_DATEFORMAT,
+    CONF_OFFLINE,
     CONF_SENSOR,
+    CONF_SKIP_UNCHANGED,
+    CONF_TRACE,
+    DATA_DIAGNOSTICS,
     DATA_KEY,
-    DATA_LISTENER,
+    DATA_SENSOR_PLATFORMS,
+    DEFAULT_ADAPTIVE,
     DEFAULT_ATTRIBUTION,
     DEFAULT_DATEFORMAT,
     DEFAULT_NAME,
+    DEFAULT_OFFLINE,
     DEFAULT_SCAN_INTERVAL,
+    DEFAULT_SKIP_UNCHANGED,
+    DEFAULT_TRACE,
     DOMAIN,
-    RDW_DATEFORMAT,
-    RDW_ENDPOINTS,
+    EVENT_APK_EXPIRED,
+    INDEX_COLUMNS,
     RESOURCE_RECALLINFO,
     SENSOR_DEFAULTS,
     SENSOR_TYPES,
+    SERVICE_IMPORT_DATASET,
+    SERVICE_REFRESH,
+    SERVICE_TRACE_REFRESH,
     TOPIC_DATA_UPDATE,
     UNDO_OPTIONS_LISTENER,
 )
-
-from sodapy import Socrata
+from .aggregate import async_get_aggregate
+from .plate import (
+    normalize_plate,
+    validate_plate,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+ATTR_DATASET = 'dataset'
+ATTR_PATH = 'path'
+ATTR_PLATE = 'plate'
+
 CONFIG_SCHEMA = vol.Schema(
     {
         DOMAIN: vol.All(
@@ -76,12 +91,84 @@ CONFIG_SCHEMA = vol.Schema(
     extra=vol.ALLOW_EXTRA,
 )
 
+SERVICE_IMPORT_DATASET_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_DATASET): vol.In(INDEX_COLUMNS),
+        vol.Required(ATTR_PATH): cv.isfile,
+    }
+)
+
+SERVICE_REFRESH_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_PLATE): vol.All(cv.ensure_list, [vol.All(cv.string, normalize_plate)]),
+    }
+)
+
 
 async def async_setup(hass, config):
     """Set up the RDW component from configuration.yaml: redirect to config_flow.async_import_step"""
 
     _LOGGER.debug("__init__::async_setup config=%s", config)
 
+    async def async_import_dataset(call):
+        """Build the local RDW index from a CSV export of a RDW dataset."""
+
+        _LOGGER.debug("__init__::async_import_dataset data=%s", call.data)
+
+        # Only files in the directories listed in allowlist_external_dirs can be read
+        if not hass.config.is_allowed_path(call.data[ATTR_PATH]):
+            _LOGGER.error("Can't read %s, no access to path!", call.data[ATTR_PATH])
+            return
+
+        # The data retrieval code (aiohttp, sqlite3) is only loaded when it's used
+        from .fleet import async_get_fleet
+
+        count = await hass.async_add_executor_job(
+            async_get_fleet(hass).index.import_csv,
+            call.data[ATTR_DATASET],
+            call.data[ATTR_PATH]
+        )
+        _LOGGER.info("Imported %d rows into the local RDW %s index", count, call.data[ATTR_DATASET])
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_IMPORT_DATASET,
+        async_import_dataset,
+        schema=SERVICE_IMPORT_DATASET_SCHEMA
+    )
+
+    async def async_refresh(call):
+        """Refresh one or more plates (default: all plates) now."""
+
+        _LOGGER.debug("__init__::async_refresh data=%s", call.data)
+
+        from .coordinator import async_get_coordinator
+
+        await async_get_coordinator(hass).async_refresh_plates(call.data.get(ATTR_PLATE))
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_REFRESH,
+        async_refresh,
+        schema=SERVICE_REFRESH_SCHEMA
+    )
+
+    @callback
+    def async_trace_refresh(call):
+        """Trace the next refresh cycle."""
+
+        _LOGGER.debug("__init__::async_trace_refresh called")
+
+        from .tracing import async_get_tracer
+
+        async_get_tracer(hass).async_arm()
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_TRACE_REFRESH,
+        async_trace_refresh
+    )
+
     if DOMAIN not in config:
         return True
 
@@ -103,9 +190,22 @@ async def async_setup_entry(hass, config_entry):
 
     _LOGGER.debug("__init__::async_setup_entry config_entry.data=%s", config_entry.data)
 
+    from .coordinator import async_get_coordinator
+    from .fleet import async_get_fleet
+
+    fleet = async_get_fleet(hass)
     rdw = RDWEntity(hass, config_entry)
-    if not await rdw.async_update():
-        raise PlatformNotReady
+
+    # Load the persistent store first, so the data of a car which was just added is stored too
+    await fleet.async_load()
+
+    # Use the data retrieved by the config flow or before a reload. Otherwise bring the entities
+    # up from the last good data, the refresh is done in the background
+    restored = False
+    if not fleet.async_take_preload(rdw):
+        restored = await fleet.async_restore(rdw)
+        if not restored and not await rdw.async_update():
+            raise PlatformNotReady
 
     if config_entry.data[CONF_NAME] is None:
         name = await rdw.create_name(rdw.manufacturer, rdw.model)
@@ -130,25 +230,14 @@ async def async_setup_entry(hass, config_entry):
             hass.config_entries.async_forward_entry_setup(config_entry, component)
         )
 
-    async def async_track_time_interval_update(event_time):
-        """Update the entity and all it's components."""
+    # The update schedule of all RDW entities is owned by the coordinator
+    async_get_coordinator(hass).async_add_entity(
+        rdw,
+        timedelta(seconds=config_entry.data[CONF_SCAN_INTERVAL])
+    )
 
-        _LOGGER.debug("RDWEntity::__init__::async_track_time_interval_update called")
-
-        if not await rdw.async_update():
-            _LOGGER.warning("Failed to update")
-        else:
-            async_dispatcher_send(hass, TOPIC_DATA_UPDATE)
-
-    hass.data[DOMAIN][config_entry.data[CONF_PLATE]].update({
-        DATA_LISTENER: {
-            config_entry.entry_id: async_track_time_interval(
-                hass,
-                async_track_time_interval_update,
-                timedelta(seconds=config_entry.data[CONF_SCAN_INTERVAL])
-            )
-        }
-    })
+    if restored:
+        hass.async_create_task(async_get_coordinator(hass).async_request_refresh(rdw))
 
     return True
 
@@ -157,16 +246,44 @@ async def async_unload_entry(hass, config_entry):
 
     _LOGGER.debug("__init__::async_unload_entry config=%s", config_entry)
 
-    cancel = hass.data[DOMAIN][config_entry.data[CONF_PLATE]][DATA_LISTENER].pop(config_entry.entry_id)
-    cancel()
+    from .coordinator import async_get_coordinator
+    from .fleet import async_get_fleet
+
+    async_get_coordinator(hass).async_remove_entity(config_entry.data[CONF_PLATE])
+    async_get_aggregate(hass).async_remove_plate(config_entry.data[CONF_PLATE])
+
+    # Keep the data for a short while, in case the entry is reloaded
+    rdw = hass.data[DOMAIN][config_entry.data[CONF_PLATE]]['entity']
+    rdw.async_cancel_expiry()
+    if rdw.vehicle is not None:
+        async_get_fleet(hass).async_preload(rdw.plate, rdw.vehicle, rdw.last_update, rdw.details, rdw.stale)
 
     for component in ("binary_sensor", "sensor"):
         await hass.config_entries.async_forward_entry_unload(config_entry, component)
 
     hass.data[DOMAIN][config_entry.data[CONF_PLATE]][UNDO_OPTIONS_LISTENER]()
 
+    # The sensors of the RDW device were removed with this config entry, move them to another one
+    hass.data[DOMAIN].get(DATA_SENSOR_PLATFORMS, {}).pop(config_entry.entry_id, None)
+    if hass.data[DOMAIN].get(DATA_DIAGNOSTICS) == config_entry.entry_id:
+        hass.data[DOMAIN].pop(DATA_DIAGNOSTICS)
+
+        if hass.data[DOMAIN].get(DATA_SENSOR_PLATFORMS):
+            from .sensor import async_add_domain_sensors
+
+            async_add_domain_sensors(hass)
+
     return True
 
+async def async_remove_entry(hass, config_entry):
+    """Remove the stored data of a RDW config entry."""
+
+    _LOGGER.debug("__init__::async_remove_entry config=%s", config_entry)
+
+    from .fleet import async_get_fleet
+
+    await async_get_fleet(hass).async_forget(config_entry.data[CONF_PLATE])
+
 async def async_options_updated(hass, config_entry):
     """Handle options update."""
     await hass.config_entries.async_reload(config_entry.entry_id)
@@ -190,25 +307,28 @@ class RDWEntity(Entity):
         self.model = None
         self.attrs = {}
 
-        self.apkdata = None
-        self.recalldata = None
+        self.vehicle = None
+        self.details = None
+        self.last_update = None
+        self.next_refresh = None
+        self.stale = False
+        self._expiry = None
+        self._async_unsub_expiry = None
 
         _LOGGER.debug("RDWEntity::__init__ called plate=%s", self._plate)
 
         if not self.validate_plate(self._plate):
             raise(RDWEntity.InvalidPlate('The plate with ID %s is invalid.' % self._plate))
 
-	# Fixed useless warning about missing app_token (not needed by RDW)
-        level = logging.getLogger().level
-        logging.getLogger().setLevel(logging.ERROR)
-        self.client = Socrata("opendata.rdw.nl", "")
-        logging.getLogger().setLevel(level)
-
         """Populate default options."""
         if not self.config_entry.options:
             data = dict(self.config_entry.data)
             options = {
                 CONF_DATEFORMAT: data.pop(CONF_DATEFORMAT, DEFAULT_DATEFORMAT),
+                CONF_SKIP_UNCHANGED: DEFAULT_SKIP_UNCHANGED,
+                CONF_OFFLINE: DEFAULT_OFFLINE,
+                CONF_ADAPTIVE: DEFAULT_ADAPTIVE,
+                CONF_TRACE: DEFAULT_TRACE,
             }
 
             self.hass.config_entries.async_update_entry(
@@ -234,86 +354,118 @@ class RDWEntity(Entity):
 
         _LOGGER.debug("RDWEntity::async_update called for %s", self._plate)
 
-        self.attrs = {}
+        from .api import RDWUnavailable
+        from .fleet import async_get_fleet
 
-        # Get APK data from the RDW Open Data API
+        # The data is retrieved by the fleet, together with the other plates which need an update
         try:
-            self.apkdata = await self.hass.async_add_executor_job(
-                partial(
-                    self.client.get,
-                    RDW_ENDPOINTS['apk']['endpoint'],
-#                    ('{}={}'.format(RDW_ENDPOINTS['apk']['rdwfilter'], self._plate)),
-                    kenteken=self._plate
-                )
-            )
-        except Exception as e:
-            _LOGGER.warning("Unable to update data from endpoint %s for %s: %s", RDW_ENDPOINTS['apk']['endpoint'], self._plate, e)
-#            raise RDWEntity.ConnectionError
+            await async_get_fleet(self.hass).async_request_update(self)
+        except RDWEntity.NotRegistered:
+            raise
+        except RDWUnavailable as e:
+            _LOGGER.debug("RDWEntity::async_update serving stale data for %s: %s", self._plate, e)
             return False
-        else:
-            _LOGGER.debug("RDWEntity::async_update endpoint %s success for %s", RDW_ENDPOINTS['apk']['endpoint'], self._plate)
-
-        # Get Recall data from the RDW Open Data API
-        try:
-            self.recalldata = await self.hass.async_add_executor_job(
-                partial(
-                    self.client.get,
-                    RDW_ENDPOINTS['recall']['endpoint'],
-#                    ('{}={}'.format(RDW_ENDPOINTS['recall']['rdwfilter'], self._plate)),
-                    kenteken=self._plate
-                )
-            )
         except Exception as e:
-            _LOGGER.warning("Unable to update data from endpoint %s for %s: %s", RDW_ENDPOINTS['recall']['endpoint'], self._plate, e)
+            _LOGGER.warning("Unable to update data from RDW for %s: %s", self._plate, e)
 #            raise RDWEntity.ConnectionError
             return False
         else:
-            _LOGGER.debug("RDWEntity::async_update endpoint %s success for %s", RDW_ENDPOINTS['recall']['endpoint'], self._plate)
+            _LOGGER.debug("RDWEntity::async_update success for %s", self._plate)
+
+        return True
+
+    def update_from_vehicle(self, vehicle, timestamp=None, details=None):
+        """Update RDW information from a parsed vehicle record."""
+
+        _LOGGER.debug("RDWEntity::update_from_vehicle called for %s", self._plate)
 
         # Check if RDW returned any data
-        if not self.apkdata:
+        if vehicle is None:
             raise RDWEntity.NotRegistered
 
-        # Manufacturer (Merk)
-        try:
-            self.manufacturer = self.apkdata[0]['merk'].title()
-        except:
-            self.manufacturer = None
+        self.vehicle = vehicle
+        self.last_update = timestamp
+        self.stale = False
+        self.manufacturer = vehicle.manufacturer
+        self.model = vehicle.model
+        self.expdate = vehicle.expdate
+        self.insured = vehicle.insured
 
-        # Model (Handelsbenaming)
-        try:
-            self.model = self.apkdata[0]['handelsbenaming'].replace(self.apkdata[0]['merk'], '').title()
-        except:
-            self.model = None
-
-        # Name of the car
-        # The RDW model field sometimes also contains the manufacturer of the car. We need to check that so that we get the name for our integration right
-        if self.manufacturer is not None or self.model is not None:
-            self._name = '{} {}'.format(self.manufacturer, self.model).title()
-        else:
-            self._name = None
+        self._name = vehicle.name
+        self.details = details
 
-        # Expire date (Vervaldatum APK)
-        try:
-            self.expdate = self.apkdata[0]['vervaldatum_apk']
-        except:
-            self.expdate = None
+        self.attrs = {}
+        for reference in vehicle.open_recalls:
+            self.attrs[reference.lower()] = RESOURCE_RECALLINFO.format(reference)
 
-        # Insurance state (WAM Verzekerd)
-        try:
-            self.insured = self.apkdata[0]['wam_verzekerd']
-        except:
-            self.insured = None
+            # Description, risk and remedy of the recall campaign
+            if details and reference in details:
+                self.attrs['{}_details'.format(reference.lower())] = details[reference]
 
-        if self.recalldata is not None:
-            for recall in self.recalldata:
-                if recall['code_status'] != 'P':
-                    self.attrs[recall['referentiecode_rdw'].lower()] = \
-                        RESOURCE_RECALLINFO.format(recall['referentiecode_rdw'])
+        self.recall = len(vehicle.open_recalls)
 
-        self.recall = len(self.attrs)
+        # Keep the fleet sensors up to date
+        async_get_aggregate(self.hass).async_update_plate(self._plate, vehicle)
 
-        return True
+        self._async_schedule_expiry()
+
+    @callback
+    def _async_schedule_expiry(self):
+        """Schedule the transition of the APK to expired at the start of the expiry date, so the
+        sensors don't have to wait for the next update."""
+
+        expiry = dt_util.start_of_local_day(self.expdate) if self.expdate is not None else None
+        if expiry == self._expiry:
+            return
+
+        self.async_cancel_expiry()
+
+        if expiry is None or expiry <= dt_util.now():
+            return
+
+        @callback
+        def async_apk_expired(now):
+            """Flip the APK to expired, without retrieving the data from RDW."""
+
+            _LOGGER.debug("RDWEntity::async_apk_expired plate=%s expdate=%s", self._plate, self.expdate)
+
+            self._async_unsub_expiry = None
+
+            self.hass.bus.async_fire(EVENT_APK_EXPIRED, {
+                CONF_PLATE: self._plate,
+                CONF_NAME: self.config_entry.data[CONF_NAME],
+                'expdate': self.expdate.isoformat(),
+            })
+            async_dispatcher_send(self.hass, f"{TOPIC_DATA_UPDATE}_{self._plate}")
+
+        _LOGGER.debug("RDWEntity::_async_schedule_expiry plate=%s at %s", self._plate, expiry)
+
+        self._expiry = expiry
+        self._async_unsub_expiry = async_track_point_in_time(self.hass, async_apk_expired, expiry)
+
+    @callback
+    def async_cancel_expiry(self):
+        """Cancel the scheduled transition of the APK to expired."""
+
+        if self._async_unsub_expiry is not None:
+            self._async_unsub_expiry()
+            self._async_unsub_expiry = None
+        self._expiry = None
+
+    @property
+    def plate(self):
+        """Return the license plate ID."""
+        return self._plate
+
+    @property
+    def offline(self):
+        """Return True if the car is looked up in the local RDW index."""
+        return self.config_entry.options.get(CONF_OFFLINE, DEFAULT_OFFLINE)
+
+    @property
+    def sensor_types(self):
+        """Return the enabled sensor and binary sensor types."""
+        return list(self.config_entry.data.get(CONF_SENSORS, [])) + list(self.config_entry.data.get(CONF_BINARY_SENSORS, []))
 
     @property
     def device_info(self):
@@ -326,27 +478,19 @@ class RDWEntity(Entity):
             "via_device": (DOMAIN),
         }
 
-    def validate_plate(self, plate):
-        """Check if the format of the user input is correct"""
-
-        if len(plate) == 6:
-            if plate.isalnum():
-                return True
-
-        return False
+    validate_plate = staticmethod(validate_plate)
 
     async def get_apk_date(self):
         if self.expdate is not None:
-            apkdate = datetime.strptime(self.expdate, RDW_DATEFORMAT)
             if self.config_entry.options[CONF_DATEFORMAT] is not None:
-                return apkdate.date().strftime(self.config_entry.options[CONF_DATEFORMAT])
+                return self.expdate.strftime(self.config_entry.options[CONF_DATEFORMAT])
             else:
-                return apkdate.date().isoformat()
+                return self.expdate.isoformat()
         else:
             return None
 
     async def is_apk_valid(self):
-        return datetime.strptime(self.expdate, RDW_DATEFORMAT) >= datetime.now()
+        return self.expdate is not None and dt_util.now() < dt_util.start_of_local_day(self.expdate)
 
 
     class ConnectionError(Exception):
@@ -0,0 +1,139 @@
+"""
+RDW aggregate - Eelco Huininga 2019-2020
+Fleet-level numbers of all configured cars: APK expiry dates, uninsured cars
+and open recalls. The numbers are maintained incrementally when the data of
+a single car changes, instead of looping over all cars. The expiry dates are
+kept in a sorted list: the counts are two bisects, O(log N), but inserting or
+removing a date shifts the list, O(N). A memmove of a few thousand pointers
+is cheaper than a balanced tree in Python at the size of a fleet.
+"""
+
+from bisect import (
+    bisect_left,
+    insort,
+)
+from datetime import timedelta
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    DATA_AGGREGATE,
+    DOMAIN,
+    FLEET_EXPIRY_WINDOW,
+    TOPIC_FLEET_UPDATE,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@callback
+def async_get_aggregate(hass):
+    """Return the shared RDWAggregate, create it if this is the first RDW entity"""
+
+    if DOMAIN not in hass.data:
+        hass.data.update({DOMAIN: {}})
+
+    if DATA_AGGREGATE not in hass.data[DOMAIN]:
+        hass.data[DOMAIN].update({DATA_AGGREGATE: RDWAggregate(hass)})
+
+    return hass.data[DOMAIN][DATA_AGGREGATE]
+
+
+class RDWAggregate:
+    """Counters and an ordered index of APK expiry dates of all configured cars"""
+
+    _LOGGER.debug("RDWAggregate class initialized")
+
+    def __init__(self, hass):
+
+        self.hass = hass
+        self.uninsured = 0
+        self.open_recalls = 0
+        self._plates = {}
+        self._expiry = []
+        self._notify = None
+
+        _LOGGER.debug("RDWAggregate::__init__ called")
+
+    @callback
+    def async_update_plate(self, plate, vehicle):
+        """Replace the contribution of a plate by the data of its vehicle record."""
+
+        record = (vehicle.expdate, vehicle.insured is False, len(vehicle.open_recalls))
+
+        previous = self._plates.get(plate)
+        if previous == record:
+            return
+
+        if previous is not None:
+            self._remove(plate, previous)
+        self._add(plate, record)
+
+        self._async_schedule_notify()
+
+    @callback
+    def async_remove_plate(self, plate):
+        """Remove the contribution of a plate."""
+
+        previous = self._plates.pop(plate, None)
+        if previous is None:
+            return
+
+        self._remove(plate, previous)
+
+        self._async_schedule_notify()
+
+    def _add(self, plate, record):
+        """Add the contribution of a plate to the counters and the expiry index, the insort is O(N)."""
+
+        expdate, uninsured, open_recalls = record
+
+        self._plates[plate] = record
+        if expdate is not None:
+            insort(self._expiry, (expdate, plate))
+        self.uninsured += uninsured
+        self.open_recalls += open_recalls
+
+    def _remove(self, plate, record):
+        """Remove the contribution of a plate from the counters and the expiry index, the del is O(N)."""
+
+        expdate, uninsured, open_recalls = record
+
+        if expdate is not None:
+            del self._expiry[bisect_left(self._expiry, (expdate, plate))]
+        self.uninsured -= uninsured
+        self.open_recalls -= open_recalls
+
+    @callback
+    def _async_schedule_notify(self):
+        """Update the fleet sensors once, after all plates of a batch have been updated."""
+
+        if self._notify is None:
+            self._notify = self.hass.loop.call_soon(self._async_notify)
+
+    @callback
+    def _async_notify(self):
+        """Update the fleet sensors."""
+
+        self._notify = None
+        async_dispatcher_send(self.hass, TOPIC_FLEET_UPDATE)
+
+    @property
+    def cars(self):
+        """Return the number of cars."""
+        return len(self._plates)
+
+    @property
+    def expired(self):
+        """Return the number of cars with an expired APK, the APK expires at the start of the expiry date."""
+        return bisect_left(self._expiry, (dt_util.now().date() + timedelta(days=1),))
+
+    def expiring(self, window=FLEET_EXPIRY_WINDOW):
+        """Return the number of cars with an APK which isn't expired yet, but expires within the window."""
+
+        tomorrow = dt_util.now().date() + timedelta(days=1)
+
+        return bisect_left(self._expiry, (tomorrow + window,)) - bisect_left(self._expiry, (tomorrow,))
@@ -0,0 +1,347 @@
+"""
+RDW API - Eelco Huininga 2019-2020
+Asynchronous client for the Socrata Open Data (SODA) API of the RDW. The
+client uses the aiohttp session of Home Assistant, so no executor threads
+are needed to retrieve data from the RDW.
+"""
+
+import asyncio
+import json
+import logging
+from time import monotonic
+
+from aiohttp import (
+    ClientError,
+    ClientResponseError,
+    ClientTimeout,
+)
+
+import homeassistant.util.dt as dt_util
+
+from . import tracing
+from .const import (
+    RDW_BACKOFF_BASE,
+    RDW_BACKOFF_MAX,
+    RDW_BACKOFF_STEPS,
+    RDW_BREAKER_COOLDOWN,
+    RDW_BREAKER_THRESHOLD,
+    METRICS_LATENCY_BUCKETS,
+    RDW_HOST,
+    RDW_RATE_BURST,
+    RDW_RATE_LIMIT,
+    RDW_RETRIES,
+    RDW_TIMEOUT,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Keyword arguments which are passed to the SODA API as SoQL clauses
+SOQL_CLAUSES = ('select', 'where', 'order', 'group', 'limit', 'offset')
+
+# States of the circuit breaker
+STATE_CLOSED = 'closed'
+STATE_HALF_OPEN = 'half_open'
+STATE_OPEN = 'open'
+
+
+class RDWUnavailable(Exception):
+    """The circuit breaker is open, no requests are sent to the RDW API"""
+
+
+def build_filter(field, values):
+    """Build a SoQL where clause which matches any of the given values"""
+
+    if isinstance(values, (list, tuple, set)):
+        return "{} in ({})".format(field, ", ".join("'{}'".format(value) for value in values))
+
+    return "{}='{}'".format(field, values)
+
+
+def chunks(values, size):
+    """Split a list of values into lists of at most size items"""
+
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+class RDWEndpointMetrics:
+    """Performance counters of the requests to one RDW endpoint"""
+
+    def __init__(self):
+
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency = None
+        self.histogram = [0] * (len(METRICS_LATENCY_BUCKETS) + 1)
+        self.response_bytes = None
+        self.rows = None
+        self.last_success = None
+        self.last_error = None
+
+    def record(self, latency, response_bytes, rows):
+        """Record a successful request."""
+
+        self.requests += 1
+        self.latency = latency
+        self.histogram[next((i for i, bucket in enumerate(METRICS_LATENCY_BUCKETS) if latency <= bucket), -1)] += 1
+        self.response_bytes = response_bytes
+        self.rows = rows
+        self.last_success = dt_util.utcnow()
+
+    def record_error(self, error):
+        """Record a failed request."""
+
+        self.requests += 1
+        self.errors += 1
+        self.last_error = str(error)
+
+    def as_dict(self):
+        """Return the counters as state attributes."""
+
+        histogram = {'<={}s'.format(bucket): count for bucket, count in zip(METRICS_LATENCY_BUCKETS, self.histogram)}
+        histogram['>{}s'.format(METRICS_LATENCY_BUCKETS[-1])] = self.histogram[-1]
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'latency_histogram': histogram,
+            'response_bytes': self.response_bytes,
+            'rows': self.rows,
+            'last_success': self.last_success.isoformat() if self.last_success else None,
+            'last_error': self.last_error,
+        }
+
+
+class RDWRateLimiter:
+    """Token bucket for all requests to the RDW API, with exponential backoff when throttled"""
+
+    _LOGGER.debug("RDWRateLimiter class initialized")
+
+    def __init__(self, rate=RDW_RATE_LIMIT, burst=RDW_RATE_BURST):
+
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = monotonic()
+        self._backoff = 0
+        self._blocked_until = 0
+        self._lock = asyncio.Lock()
+
+        _LOGGER.debug("RDWRateLimiter::__init__ called rate=%s burst=%s", rate, burst)
+
+    @property
+    def budget(self):
+        """Return the current number of requests per second."""
+        return self.rate / 2 ** self._backoff
+
+    async def acquire(self):
+        """Wait until a request to the RDW API is allowed."""
+
+        async with self._lock:
+            while True:
+                now = monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.budget)
+                self._updated = now
+
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep(max(self._blocked_until - now, (1 - self._tokens) / self.budget))
+
+    def backoff(self, retry_after=None):
+        """Halve the request budget and pause all requests after the API throttled or failed."""
+
+        self._backoff = min(self._backoff + 1, RDW_BACKOFF_STEPS)
+        delay = min(RDW_BACKOFF_MAX, retry_after or RDW_BACKOFF_BASE * 2 ** (self._backoff - 1))
+        self._blocked_until = max(self._blocked_until, monotonic() + delay)
+        self._tokens = 0
+
+        _LOGGER.warning("RDW API is throttling, pausing requests for %.1f seconds. Request budget lowered to %.2f requests/s", delay, self.budget)
+
+    def success(self):
+        """Restore the request budget step by step after successful requests."""
+
+        if self._backoff > 0:
+            self._backoff -= 1
+            _LOGGER.debug("RDWRateLimiter::success request budget raised to %.2f requests/s", self.budget)
+
+
+class RDWCircuitBreaker:
+    """Stops all requests to the RDW API for a cool-down period after repeated failures"""
+
+    _LOGGER.debug("RDWCircuitBreaker class initialized")
+
+    def __init__(self, threshold=RDW_BREAKER_THRESHOLD, cooldown=RDW_BREAKER_COOLDOWN):
+
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self._opened = 0
+        self._probe = False
+
+        _LOGGER.debug("RDWCircuitBreaker::__init__ called threshold=%d cooldown=%d", threshold, cooldown)
+
+    @staticmethod
+    def is_failure(error):
+        """Return True if an error means the RDW API is unavailable, instead of a bad request."""
+
+        if isinstance(error, ClientResponseError):
+            return error.status == 429 or error.status >= 500
+
+        return isinstance(error, (ClientError, asyncio.TimeoutError))
+
+    def before_request(self):
+        """Raise RDWUnavailable if the breaker is open. After the cool-down period a single
+        probe request is let through, the other requests fail until the probe succeeds."""
+
+        if self.state == STATE_CLOSED:
+            return
+
+        if self.state == STATE_OPEN and monotonic() - self._opened >= self.cooldown:
+            _LOGGER.debug("RDWCircuitBreaker::before_request cool-down ended, probing the RDW API")
+            self.state = STATE_HALF_OPEN
+
+        if self.state == STATE_HALF_OPEN and not self._probe:
+            self._probe = True
+            return
+
+        raise RDWUnavailable('The RDW API is unavailable, requests are paused')
+
+    def success(self):
+        """Close the breaker after a successful request."""
+
+        if self.state != STATE_CLOSED:
+            _LOGGER.warning("RDW API is available again, resuming requests")
+
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self._probe = False
+
+    def failure(self, error):
+        """Count a failed request, and open the breaker after too many failures or a failed probe."""
+
+        if not self.is_failure(error):
+            # A request which fails for another reason (for example a bad query) ends the probe too
+            self._probe = False
+            return
+
+        self.failures += 1
+
+        if self.state == STATE_HALF_OPEN or (self.state == STATE_CLOSED and self.failures >= self.threshold):
+            _LOGGER.warning("RDW API is unavailable (%s), pausing all requests for %d seconds", error, self.cooldown)
+            self.state = STATE_OPEN
+            self._opened = monotonic()
+            self._probe = False
+
+
+class RDWClient:
+    """Asynchronous client for the SODA API of the RDW"""
+
+    _LOGGER.debug("RDWClient class initialized")
+
+    def __init__(self, session, host=RDW_HOST, limiter=None, breaker=None):
+
+        self.session = session
+        self.host = host
+        self.limiter = limiter or RDWRateLimiter()
+        self.breaker = breaker or RDWCircuitBreaker()
+        self.metrics = {}
+
+        _LOGGER.debug("RDWClient::__init__ called host=%s", host)
+
+    async def get(self, dataset_identifier, **kwargs):
+        """Get the rows of a dataset. The call is shaped like sodapy's Socrata.get():
+        SoQL clauses (where, select, limit, ...) are passed as keyword arguments, and
+        all other keyword arguments are column filters. A column filter can be a single
+        value or a list of values."""
+
+        clauses = {}
+        filters = []
+
+        for key, value in kwargs.items():
+            if key in SOQL_CLAUSES:
+                clauses[key] = str(value)
+            else:
+                filters.append(build_filter(key, value))
+
+        if filters:
+            if 'where' in clauses:
+                filters.append('({})'.format(clauses['where']))
+            clauses['where'] = ' AND '.join(filters)
+
+        params = {'$' + key: value for key, value in clauses.items()}
+
+        url = 'https://{}/resource/{}.json'.format(self.host, dataset_identifier)
+
+        _LOGGER.debug("RDWClient::get url=%s params=%s", url, params)
+
+        return await self._async_request(url, params, self.metrics.setdefault(dataset_identifier, RDWEndpointMetrics()))
+
+    async def get_metadata(self, dataset_identifier):
+        """Get the metadata of a dataset, which includes the time its rows were last updated."""
+
+        url = 'https://{}/api/views/{}.json'.format(self.host, dataset_identifier)
+
+        _LOGGER.debug("RDWClient::get_metadata url=%s", url)
+
+        return await self._async_request(url)
+
+    async def _async_request(self, url, params=None, metrics=None):
+        """Request an URL through the circuit breaker and rate limiter, retry when the API throttles or fails."""
+
+        self.breaker.before_request()
+
+        try:
+            for attempt in range(RDW_RETRIES + 1):
+                with tracing.span('rate_limit'):
+                    await self.limiter.acquire()
+
+                start = monotonic()
+
+                with tracing.span('http', url=url, attempt=attempt) as span:
+                    async with self.session.get(url, params=params, timeout=ClientTimeout(total=RDW_TIMEOUT)) as response:
+                        if span is not None:
+                            span.attributes['status'] = response.status
+
+                        if response.status == 429 or response.status >= 500:
+                            try:
+                                retry_after = float(response.headers.get('Retry-After'))
+                            except (TypeError, ValueError):
+                                retry_after = None
+
+                            self.limiter.backoff(retry_after)
+
+                            if attempt < RDW_RETRIES:
+                                _LOGGER.debug("RDWClient::_async_request status %d for %s, retrying", response.status, url)
+                                if metrics is not None:
+                                    metrics.retries += 1
+                                continue
+
+                        response.raise_for_status()
+                        self.limiter.success()
+
+                        body = await response.read()
+
+                with tracing.span('parse', response_bytes=len(body)):
+                    result = json.loads(body)
+
+                if metrics is not None:
+                    metrics.record(monotonic() - start, len(body), len(result) if isinstance(result, list) else None)
+
+                self.breaker.success()
+
+                return result
+
+        except asyncio.CancelledError as e:
+            # Release the probe of the circuit breaker, the request didn't fail
+            self.breaker.failure(e)
+            raise
+
+        except Exception as e:
+            self.breaker.failure(e)
+            if metrics is not None:
+                metrics.record_error(e)
+            raise
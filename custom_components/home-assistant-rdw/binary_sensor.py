@@ -18,7 +18,10 @@ from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import Entity
 
+from . import tracing
 from .const import (
+    ATTR_LAST_UPDATE,
+    ATTR_STALE,
     ATTRIBUTION,
     BINARY_SENSOR_TYPES,
     CONF_PLATE,
@@ -95,6 +98,8 @@ class RDWBinarySensor(Entity):
         attributes = {
             ATTR_ATTRIBUTION: ATTRIBUTION,
             ATTR_ID: f"nl_{self._plate.lower()}",
+            ATTR_LAST_UPDATE: self._data.last_update.isoformat() if self._data.last_update else None,
+            ATTR_STALE: self._data.stale,
         }
 
         return attributes
@@ -144,11 +149,15 @@ class RDWBinarySensor(Entity):
 
         if self._sensor_type == 'insured':
             if self._data.insured is not None:
-                if self._data.insured == 'Ja':
-                    self._state = True
-                elif self._data.insured == 'Nee':
-                    self._state = False
-                    self._icon = BINARY_SENSOR_TYPES['insured'][2]
+                self._state = self._data.insured
+                self._icon = BINARY_SENSOR_TYPES['insured'][1] if self._data.insured else BINARY_SENSOR_TYPES['insured'][2]
+
+    async def _async_refresh(self):
+        """Update the sensor and write its state."""
+
+        with tracing.span('state_write', entity_id=self.entity_id):
+            await self.async_update()
+            self.async_write_ha_state()
 
     async def async_added_to_hass(self):
         """Register callbacks."""
@@ -161,12 +170,11 @@ class RDWBinarySensor(Entity):
 
             _LOGGER.debug("RDWBinarySensor::async_added_to_hass::update plate=%s sensor=%s", self._plate, self._sensor_type)
 
-            self.hass.async_create_task(self.async_update())
-            self.async_schedule_update_ha_state(False)
+            tracing.track(self.hass.async_create_task(self._async_refresh()))
 
         self._async_unsub_dispatcher_connect = async_dispatcher_connect(
             self.hass,
-            TOPIC_DATA_UPDATE,
+            f"{TOPIC_DATA_UPDATE}_{self._plate}",
             update
         )
 
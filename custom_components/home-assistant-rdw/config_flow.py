@@ -7,6 +7,7 @@ and recall information
 
 
 import logging
+import re
 import voluptuous as vol
 from datetime import (
     datetime,
@@ -26,23 +27,39 @@ from homeassistant.helpers import config_validation as cv
 
 from .const import (
     BINARY_SENSOR_DEFAULTS,
+    CONF_ADAPTIVE,
     CONF_MANUFACTURER,
     CONF_MODEL,
     CONF_DATEFORMAT,
+    CONF_OFFLINE,
     CONF_PLATE,
+    CONF_PLATES,
+    CONF_SKIP_UNCHANGED,
+    CONF_TRACE,
     DATA_KEY,
+    DEFAULT_ADAPTIVE,
     DEFAULT_DATEFORMAT,
     DEFAULT_NAME,
+    DEFAULT_OFFLINE,
     DEFAULT_SCAN_INTERVAL,
+    DEFAULT_SKIP_UNCHANGED,
+    DEFAULT_TRACE,
     DOMAIN,
     SENSOR_DEFAULTS,
+    SOURCE_BULK,
+)
+from .plate import (
+    normalize_plate,
+    validate_plate,
 )
-from . import RDWEntity
 
 _LOGGER = logging.getLogger(__name__)
 
 _LOGGER.debug("config_flow called")
 
+# Separators between the plates of a pasted list or CSV, spaces are part of a plate like "AB 12 CD"
+PLATE_SEPARATORS = re.compile(r'[,;\r\n]+')
+
 
 @config_entries.HANDLERS.register(DOMAIN)
 class RDWFlowHandler(config_entries.ConfigFlow):
@@ -98,46 +115,55 @@ class RDWFlowHandler(config_entries.ConfigFlow):
         _LOGGER.debug("RDWFlowHandler::async_step_user called %s", user_input)
 
         errors = {}
-        config_entry = {'data', user_input}
 
         if user_input is not None:
 
-            user_input.update({CONF_PLATE: user_input[CONF_PLATE].upper().replace("-", "")})
+            # A list of plates is handled by the bulk step
+            if len(PLATE_SEPARATORS.split(user_input[CONF_PLATE].strip())) > 1:
+                return await self.async_step_bulk({CONF_PLATES: user_input[CONF_PLATE]})
+
+            user_input.update({CONF_PLATE: normalize_plate(user_input[CONF_PLATE])})
 
             # Check if already configured
             await self.async_set_unique_id(user_input[CONF_PLATE], raise_on_progress=False)
             self._abort_if_unique_id_configured()
 
-            try:
-                rdwdata = RDWEntity(self.hass, config_entry)
-                await rdwdata.async_update()
-
-            except RDWEntity.InvalidPlate:
+            if not validate_plate(user_input[CONF_PLATE]):
                 errors["base"] = "invalid_plate"
 
-            except RDWEntity.NotRegistered:
-                errors["base"] = "not_registered"
-
-            except Exception as e:
-                _LOGGER.debug("RDWFlowHandler::async_step_user update_about_data exception unknown_error: %s", str(e))
-                errors["base"] = "unknown_error"
-
             else:
-                _LOGGER.debug("RDWFlowHandler::async_step_user rdwdata.update() succesfull. rdwdata=%s", rdwdata)
-
-                self.config = {
-                    CONF_PLATE: user_input[CONF_PLATE],
-                    CONF_NAME: rdwdata._name,
-                    CONF_MANUFACTURER: rdwdata.manufacturer,
-                    CONF_MODEL: rdwdata.model,
-                    CONF_BINARY_SENSORS: BINARY_SENSOR_DEFAULTS,
-                    CONF_SENSORS: SENSOR_DEFAULTS,
-                    CONF_SCAN_INTERVAL: int(user_input.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL.total_seconds())),
-                    CONF_DATEFORMAT: DEFAULT_DATEFORMAT,
-                }
-                _LOGGER.debug("config=%s", self.config)
-
-                return await self.async_step_details(None)
+                # The data retrieval code is only loaded when a plate is looked up
+                from .fleet import async_get_fleet
+
+                # The vehicle record is kept by the fleet, so async_setup_entry doesn't fetch it again
+                vehicle = (await async_get_fleet(self.hass).async_lookup(
+                    [user_input[CONF_PLATE]],
+                    SENSOR_DEFAULTS + BINARY_SENSOR_DEFAULTS
+                ))[user_input[CONF_PLATE]]
+
+                if isinstance(vehicle, Exception):
+                    _LOGGER.debug("RDWFlowHandler::async_step_user lookup exception connection_error: %s", str(vehicle))
+                    errors["base"] = "connection_error"
+
+                elif vehicle is None:
+                    errors["base"] = "not_registered"
+
+                else:
+                    _LOGGER.debug("RDWFlowHandler::async_step_user lookup succesfull. vehicle=%s", vehicle.as_dict())
+
+                    self.config = {
+                        CONF_PLATE: user_input[CONF_PLATE],
+                        CONF_NAME: vehicle.name,
+                        CONF_MANUFACTURER: vehicle.manufacturer,
+                        CONF_MODEL: vehicle.model,
+                        CONF_BINARY_SENSORS: BINARY_SENSOR_DEFAULTS,
+                        CONF_SENSORS: SENSOR_DEFAULTS,
+                        CONF_SCAN_INTERVAL: int(user_input.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL.total_seconds())),
+                        CONF_DATEFORMAT: DEFAULT_DATEFORMAT,
+                    }
+                    _LOGGER.debug("config=%s", self.config)
+
+                    return await self.async_step_details(None)
 
         _LOGGER.debug("RDWFlowHandler::async_step_user show form")
         return self.async_show_form(
@@ -150,6 +176,114 @@ class RDWFlowHandler(config_entries.ConfigFlow):
             errors=errors,
         )
 
+    async def async_step_bulk(self, user_input=None):
+        """Handle a list of plates: validate them in batched lookups and add all valid cars at once."""
+
+        _LOGGER.debug("RDWFlowHandler::async_step_bulk called %s", user_input)
+
+        errors = {}
+        invalid = []
+        failed = []
+        configured = []
+
+        if user_input is not None:
+
+            plates = []
+            current = {entry.unique_id for entry in self._async_current_entries()}
+
+            for plate in PLATE_SEPARATORS.split(user_input[CONF_PLATES].strip()):
+                plate = normalize_plate(plate)
+                if not plate or plate in plates or plate in invalid or plate in configured:
+                    continue
+                if plate in current:
+                    configured.append(plate)
+                    continue
+                if not validate_plate(plate):
+                    invalid.append(plate)
+                    continue
+                plates.append(plate)
+
+            from .fleet import async_get_fleet
+
+            # The vehicle records are kept by the fleet, so async_setup_entry doesn't fetch them again
+            vehicles = await async_get_fleet(self.hass).async_lookup(
+                plates,
+                SENSOR_DEFAULTS + BINARY_SENSOR_DEFAULTS
+            ) if plates else {}
+
+            added = 0
+            for plate, vehicle in vehicles.items():
+                # A failed lookup (RDW API unavailable) doesn't mean the plate isn't registered
+                if isinstance(vehicle, Exception):
+                    failed.append(plate)
+                    continue
+                if vehicle is None:
+                    invalid.append(plate)
+                    continue
+
+                added += 1
+                self.hass.async_create_task(
+                    self.hass.config_entries.flow.async_init(
+                        DOMAIN,
+                        context={"source": SOURCE_BULK},
+                        data={
+                            CONF_PLATE: plate,
+                            CONF_NAME: vehicle.name,
+                            CONF_MANUFACTURER: vehicle.manufacturer,
+                            CONF_MODEL: vehicle.model,
+                            CONF_BINARY_SENSORS: BINARY_SENSOR_DEFAULTS,
+                            CONF_SENSORS: SENSOR_DEFAULTS,
+                            CONF_SCAN_INTERVAL: int(DEFAULT_SCAN_INTERVAL.total_seconds()),
+                            CONF_DATEFORMAT: DEFAULT_DATEFORMAT,
+                        },
+                    )
+                )
+
+            _LOGGER.debug("RDWFlowHandler::async_step_bulk added=%d invalid=%s failed=%s configured=%s", added, invalid, failed, configured)
+
+            if added > 0:
+                return self.async_abort(
+                    reason="bulk_added",
+                    description_placeholders={
+                        "added": str(added),
+                        "invalid": ", ".join(invalid) or "-",
+                        "failed": ", ".join(failed) or "-",
+                        "configured": ", ".join(configured) or "-",
+                    },
+                )
+
+            errors["base"] = "connection_error" if failed else "no_valid_plates"
+
+        _LOGGER.debug("RDWFlowHandler::async_step_bulk show form")
+        return self.async_show_form(
+            step_id="bulk",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(CONF_PLATES, default=user_input[CONF_PLATES] if user_input else ""): str,
+                }
+            ),
+            description_placeholders={
+                "invalid": ", ".join(invalid) or "-",
+                "failed": ", ".join(failed) or "-",
+                "configured": ", ".join(configured) or "-",
+            },
+            errors=errors,
+        )
+
+    async def async_step_bulk_import(self, import_config):
+        """Create the config entry of a car which was added by the bulk step."""
+
+        _LOGGER.debug("RDWFlowHandler::async_step_bulk_import called %s", import_config)
+
+        # Check if already configured
+        await self.async_set_unique_id(import_config[CONF_PLATE], raise_on_progress=False)
+        self._abort_if_unique_id_configured()
+
+        return self.async_create_entry(
+            title=import_config[CONF_NAME] or import_config[CONF_PLATE],
+            data=import_config
+        )
+
     async def async_step_details(self, user_input=None):
         """Handle a flow initialized by the user."""
 
@@ -220,6 +354,34 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                             DEFAULT_DATEFORMAT,
                         ),
                     ): str,
+                    vol.Optional(
+                        CONF_SKIP_UNCHANGED,
+                        default=self.config_entry.options.get(
+                            CONF_SKIP_UNCHANGED,
+                            DEFAULT_SKIP_UNCHANGED,
+                        ),
+                    ): bool,
+                    vol.Optional(
+                        CONF_OFFLINE,
+                        default=self.config_entry.options.get(
+                            CONF_OFFLINE,
+                            DEFAULT_OFFLINE,
+                        ),
+                    ): bool,
+                    vol.Optional(
+                        CONF_ADAPTIVE,
+                        default=self.config_entry.options.get(
+                            CONF_ADAPTIVE,
+                            DEFAULT_ADAPTIVE,
+                        ),
+                    ): bool,
+                    vol.Optional(
+                        CONF_TRACE,
+                        default=self.config_entry.options.get(
+                            CONF_TRACE,
+                            DEFAULT_TRACE,
+                        ),
+                    ): bool,
                 }
             ),
         )
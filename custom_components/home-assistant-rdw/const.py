@@ -4,24 +4,67 @@ from datetime import (
     timedelta,
 )
 
+ADAPTIVE_EXPIRY_WINDOW = timedelta(days=30)
+ADAPTIVE_MAX_INTERVAL = timedelta(days=28)
+
+ATTR_APK_VALID = 'apk_valid'
+ATTR_LAST_UPDATE = 'last_update'
+ATTR_STALE = 'stale'
+
 ATTRIBUTION = "Data provided by RDW"
 
+CONF_ADAPTIVE = 'adaptive'
 CONF_BINARY_SENSOR = "binary_sensor"
 CONF_MANUFACTURER = "manufacturer"
 CONF_MODEL = "model"
+CONF_OFFLINE = 'offline'
 CONF_DATEFORMAT = 'dateformat'
 CONF_PLATE = 'plate'
+CONF_PLATES = 'plates'
 CONF_SENSOR = "sensor"
+CONF_SKIP_UNCHANGED = 'skip_unchanged'
+CONF_TRACE = 'trace'
 
+DEFAULT_ADAPTIVE = False
 DEFAULT_NAME = 'RDW'
+DEFAULT_OFFLINE = False
 DEFAULT_ATTRIBUTION = 'Data provided by RDW'
 DEFAULT_DATEFORMAT = None
 DEFAULT_SCAN_INTERVAL = timedelta(hours=24)
+DEFAULT_SKIP_UNCHANGED = False
+DEFAULT_TRACE = False
 
 DOMAIN = "rdw"
 DATA_KEY = DOMAIN
-DATA_LISTENER = "listener"
+DATA_AGGREGATE = "aggregate"
+DATA_COORDINATOR = "coordinator"
+DATA_DIAGNOSTICS = "diagnostics"
+DATA_FLEET = "fleet"
+DATA_SENSOR_PLATFORMS = "sensor_platforms"
+DATA_TRACER = "tracer"
+
+EVENT_APK_EXPIRED = f"{DOMAIN}_apk_expired"
+
+FLEET_EXPIRY_WINDOW = timedelta(days=30)
+
+INDEX_BATCH_SIZE = 10000
+INDEX_COLUMNS = {
+    'apk':    ['kenteken', 'merk', 'handelsbenaming', 'vervaldatum_apk', 'wam_verzekerd'],
+    'recall': ['kenteken', 'referentiecode_rdw', 'code_status'],
+}
+INDEX_FILENAME = 'rdw.db'
+
+METRICS_LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+PRELOAD_TTL = timedelta(minutes=5)
 
+RDW_BACKOFF_BASE = 2
+RDW_BACKOFF_MAX = 300
+RDW_BACKOFF_STEPS = 6
+RDW_BATCH_DELAY = 1
+RDW_BATCH_SIZE = 50
+RDW_BREAKER_COOLDOWN = 300
+RDW_BREAKER_THRESHOLD = 5
 RDW_DATEFORMAT = '%Y%m%d'
 RDW_ENDPOINTS = {
     'apk':                 {'endpoint': 'm9d7-ebf2', 'rdwfilter': 'kenteken'},
@@ -30,10 +73,39 @@ RDW_ENDPOINTS = {
     'recall_risk':         {'endpoint': '9ihi-jgpf', 'rdwfilter': 'referentiecode_rdw'},
     'recall_details':      {'endpoint': 'j9yg-7rg9', 'rdwfilter': 'referentiecode_rdw'},
 }
+RDW_HOST = 'opendata.rdw.nl'
+RDW_METADATA_TTL = timedelta(hours=1)
+RDW_QUERY_LIMIT = 50000
+RDW_RATE_BURST = 10
+RDW_RATE_LIMIT = 5
+RDW_RETRIES = 3
+RDW_SCHEDULE_MIN_SLOT = timedelta(minutes=1)
+RDW_SCHEDULE_SLOTS = 24
+RDW_SYNC_DATEFORMAT = '%Y-%m-%dT%H:%M:%S'
+RDW_TIMEOUT = 30
+
+RECALL_CACHE_SIZE = 512
+RECALL_CACHE_TTL = timedelta(days=1)
+RECALL_SYNC_INTERVAL = timedelta(days=7)
+RECALL_SYNC_MARGIN = timedelta(hours=1)
 
 RESOURCE_RECALLINFO = 'https://terugroepregister.rdw.nl/Pages/Terugroepactie.aspx?mgpnummer={}'
 
+SERVICE_IMPORT_DATASET = 'import_dataset'
+SERVICE_REFRESH = 'refresh'
+SERVICE_TRACE_REFRESH = 'trace_refresh'
+
+SOURCE_BULK = 'bulk_import'
+
+STORAGE_KEY = DOMAIN
+STORAGE_SAVE_DELAY = 10
+STORAGE_VERSION = 1
+
+TRACE_FILENAME = 'rdw_trace.json'
+
 TOPIC_DATA_UPDATE = f"{DOMAIN}_data_update"
+TOPIC_FLEET_UPDATE = f"{DOMAIN}_fleet_update"
+TOPIC_METRICS_UPDATE = f"{DOMAIN}_metrics_update"
 UNDO_OPTIONS_LISTENER = "undo_update_listener"
 
 BINARY_SENSOR_TYPES = {
@@ -45,6 +117,12 @@ SENSOR_TYPES = {
     'recall':  ['Recall',  'mdi:wrench',   'mdi:alert-outline'],
 }
 
+FLEET_SENSOR_TYPES = {
+    'apk_expiring': ['APK expiring', 'mdi:calendar-alert', 'cars'],
+    'uninsured':    ['Uninsured',    'mdi:car-off',        'cars'],
+    'open_recalls': ['Open recalls', 'mdi:wrench',         'recalls'],
+}
+
 BINARY_SENSOR_DEFAULTS = [
     "insured",
 ]
@@ -54,3 +132,20 @@ SENSOR_DEFAULTS = [
     "recall",
 ]
 
+
+# RDW datasets which are always retrieved, for the registration check and the device info
+RDW_BASE_ENDPOINTS = ['apk']
+
+# Fields of the RDW datasets which are always retrieved, if the dataset is retrieved
+RDW_FIELDS = {
+    'apk':    ['kenteken', 'merk', 'handelsbenaming'],
+    'recall': ['kenteken'],
+}
+
+# Fields of the RDW datasets which are retrieved for each sensor. A dataset is only
+# retrieved if one of the enabled sensors needs it
+SENSOR_FIELDS = {
+    'expdate': {'apk': ['vervaldatum_apk']},
+    'insured': {'apk': ['wam_verzekerd']},
+    'recall':  {'recall': ['referentiecode_rdw', 'code_status']},
+}
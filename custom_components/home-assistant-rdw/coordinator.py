@@ -0,0 +1,233 @@
+"""
+RDW coordinator - Eelco Huininga 2019-2020
+Owns the update schedule for all configured cars. Cars are grouped by their
+scan interval, and each interval is divided into slots. Every car is assigned
+to a slot by a hash of its plate, so the refreshes are spread evenly over the
+interval and keep the same spread across restarts.
+"""
+
+import asyncio
+import hashlib
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_track_point_in_utc_time
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    ADAPTIVE_EXPIRY_WINDOW,
+    ADAPTIVE_MAX_INTERVAL,
+    CONF_ADAPTIVE,
+    CONF_TRACE,
+    DATA_COORDINATOR,
+    DEFAULT_ADAPTIVE,
+    DEFAULT_TRACE,
+    DOMAIN,
+    RDW_SCHEDULE_MIN_SLOT,
+    RDW_SCHEDULE_SLOTS,
+    TOPIC_DATA_UPDATE,
+)
+from . import tracing
+from .fleet import async_get_fleet
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@callback
+def async_get_coordinator(hass):
+    """Return the shared RDWCoordinator, create it if this is the first RDW entity"""
+
+    if DOMAIN not in hass.data:
+        hass.data.update({DOMAIN: {}})
+
+    if DATA_COORDINATOR not in hass.data[DOMAIN]:
+        hass.data[DOMAIN].update({DATA_COORDINATOR: RDWCoordinator(hass)})
+
+    return hass.data[DOMAIN][DATA_COORDINATOR]
+
+
+def get_slots(interval):
+    """Return the number of slots and the length of a slot (in seconds) of an interval"""
+
+    slot_length = max(interval.total_seconds() / RDW_SCHEDULE_SLOTS, RDW_SCHEDULE_MIN_SLOT.total_seconds())
+    slots = max(1, round(interval.total_seconds() / slot_length))
+
+    return slots, interval.total_seconds() / slots
+
+
+def get_plate_slot(plate, slots):
+    """Return the slot of a plate. The slot is derived from a hash of the plate, so it's stable across restarts"""
+
+    return int(hashlib.sha256(plate.encode()).hexdigest(), 16) % slots
+
+
+def get_adaptive_interval(rdw, interval):
+    """Return the time until the next refresh of a RDW entity, based on its APK expiry date and open recalls"""
+
+    # Open recalls and APK dates which are (nearly) expired are refreshed every scan interval
+    if rdw.recall or rdw.expdate is None:
+        return interval
+
+    expiry = dt_util.as_utc(dt_util.start_of_local_day(rdw.expdate))
+    quiet = expiry - ADAPTIVE_EXPIRY_WINDOW - dt_util.utcnow()
+
+    return max(interval, min(quiet, ADAPTIVE_MAX_INTERVAL))
+
+
+class RDWCoordinator:
+    """Update schedule for all RDW entities"""
+
+    _LOGGER.debug("RDWCoordinator class initialized")
+
+    def __init__(self, hass):
+
+        self.hass = hass
+        self._buckets = {}
+        self._listeners = {}
+
+        _LOGGER.debug("RDWCoordinator::__init__ called")
+
+    @callback
+    def async_add_entity(self, rdw, interval):
+        """Add a RDW entity to the bucket of its scan interval."""
+
+        _LOGGER.debug("RDWCoordinator::async_add_entity plate=%s interval=%s", rdw.plate, interval)
+
+        self.async_remove_entity(rdw.plate)
+
+        self._buckets.setdefault(interval, {}).update({rdw.plate: rdw})
+
+        if interval not in self._listeners:
+            self._async_schedule(interval)
+
+    @callback
+    def _async_schedule(self, interval):
+        """Schedule the update of the next slot of an interval bucket."""
+
+        slots, slot_length = get_slots(interval)
+
+        # Slots are anchored on the epoch, so the schedule doesn't depend on the time Home Assistant was started
+        boundary = (int(dt_util.utcnow().timestamp() // slot_length) + 1) * slot_length
+        slot = int(round(boundary / slot_length)) % slots
+
+        async def async_track_point_in_utc_time_update(event_time):
+            """Update the entities in this slot and all their components."""
+            self._async_schedule(interval)
+            await self.async_refresh(interval, slot)
+
+        self._listeners[interval] = async_track_point_in_utc_time(
+            self.hass,
+            async_track_point_in_utc_time_update,
+            dt_util.utc_from_timestamp(boundary)
+        )
+
+    @callback
+    def async_remove_entity(self, plate):
+        """Remove a RDW entity, and stop the timer of its bucket if it was the last one."""
+
+        for interval in list(self._buckets):
+            if self._buckets[interval].pop(plate, None) is None:
+                continue
+
+            _LOGGER.debug("RDWCoordinator::async_remove_entity plate=%s interval=%s", plate, interval)
+
+            if not self._buckets[interval]:
+                del self._buckets[interval]
+                self._listeners.pop(interval)()
+
+    @staticmethod
+    def _is_adaptive(rdw):
+        """Return True if the RDW entity uses adaptive polling."""
+
+        return rdw.config_entry.options.get(CONF_ADAPTIVE, DEFAULT_ADAPTIVE)
+
+    async def async_request_refresh(self, rdw):
+        """Refresh a single RDW entity, batched with the other pending requests."""
+
+        _LOGGER.debug("RDWCoordinator::async_request_refresh called for %s", rdw.plate)
+
+        try:
+            await rdw.async_update()
+        except Exception as e:
+            _LOGGER.warning("Failed to update %s: %s", rdw.plate, e)
+            return
+
+        # Also after a failed update, so the sensors show that their data is stale
+        async_dispatcher_send(self.hass, f"{TOPIC_DATA_UPDATE}_{rdw.plate}")
+
+    async def async_refresh(self, interval, slot=None):
+        """Update the entities in a slot (default: all entities) of a bucket and all their components."""
+
+        _LOGGER.debug("RDWCoordinator::async_refresh called interval=%s slot=%s", interval, slot)
+
+        fleet = async_get_fleet(self.hass)
+        tracer = tracing.async_get_tracer(self.hass)
+        slots, _ = get_slots(interval)
+
+        # Entities with adaptive polling are skipped until they're due; the slot of an entity
+        # is visited once per interval, so it's due if the next refresh is within half an interval
+        due = dt_util.utcnow() + interval / 2
+
+        entities = [
+            rdw
+            for plate, rdw in self._buckets.get(interval, {}).items()
+            if (slot is None or get_plate_slot(plate, slots) == slot) and
+                (not self._is_adaptive(rdw) or rdw.next_refresh is None or rdw.next_refresh <= due)
+        ]
+        if not entities:
+            return
+
+        trace = any(rdw.config_entry.options.get(CONF_TRACE, DEFAULT_TRACE) for rdw in entities)
+
+        async with tracer.async_trace('refresh', trace, interval=str(interval), slot=slot, plates=len(entities)):
+            await self._async_refresh(fleet, entities, interval)
+
+    async def async_refresh_plates(self, plates=None):
+        """Refresh the given plates (default: all plates) now, regardless of their schedule. Plates
+        which are already being refreshed join the running refresh instead of starting another one."""
+
+        _LOGGER.debug("RDWCoordinator::async_refresh_plates called plates=%s", plates)
+
+        fleet = async_get_fleet(self.hass)
+        tracer = tracing.async_get_tracer(self.hass)
+
+        buckets = {
+            interval: [rdw for plate, rdw in bucket.items() if plates is None or plate in plates]
+            for interval, bucket in self._buckets.items()
+        }
+        buckets = {interval: entities for interval, entities in buckets.items() if entities}
+        if not buckets:
+            return
+
+        async with tracer.async_trace('refresh', plates=sum(len(entities) for entities in buckets.values())):
+            await asyncio.gather(*[
+                self._async_refresh(fleet, entities, interval, force=True)
+                for interval, entities in buckets.items()
+            ])
+
+    async def _async_refresh(self, fleet, entities, interval, force=False):
+        """Update a list of entities and all their components. Unless forced, entities with the
+        skip_unchanged option are skipped when the RDW datasets haven't changed."""
+
+        if not force:
+            with tracing.span('metadata'):
+                entities = await fleet.async_get_changed(entities)
+            if not entities:
+                return
+
+        results = await fleet.async_update(entities)
+
+        for rdw in entities:
+            if results.get(rdw.plate) and self._is_adaptive(rdw):
+                rdw.next_refresh = rdw.last_update + get_adaptive_interval(rdw, interval)
+                _LOGGER.debug("RDWCoordinator::async_refresh next refresh of %s at %s", rdw.plate, rdw.next_refresh)
+
+        with tracing.span('fan_out', plates=len(results)):
+            for plate, result in results.items():
+                if not result:
+                    _LOGGER.debug("RDWCoordinator::_async_refresh serving stale data for %s", plate)
+
+                # Only wake up the entities of the car which was refreshed. Also after a failed
+                # update, so the sensors show that their data is stale
+                async_dispatcher_send(self.hass, f"{TOPIC_DATA_UPDATE}_{plate}")
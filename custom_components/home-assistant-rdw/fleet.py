@@ -0,0 +1,633 @@
+"""
+RDW fleet - Eelco Huininga 2019-2020
+Batched retrieval of RDW data for all configured cars. Instead of querying
+the RDW Open Data API once per plate per endpoint, the plates are grouped
+into chunked 'kenteken in (...)' queries and the rows are handed back to
+each plate's RDWEntity.
+"""
+
+import asyncio
+import logging
+from time import monotonic
+
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.storage import Store
+import homeassistant.util.dt as dt_util
+
+from . import tracing
+from .const import (
+    CONF_SKIP_UNCHANGED,
+    DATA_FLEET,
+    DEFAULT_SKIP_UNCHANGED,
+    DOMAIN,
+    INDEX_FILENAME,
+    PRELOAD_TTL,
+    RDW_BATCH_DELAY,
+    RDW_BASE_ENDPOINTS,
+    RDW_BATCH_SIZE,
+    RDW_ENDPOINTS,
+    RDW_FIELDS,
+    RDW_METADATA_TTL,
+    RDW_QUERY_LIMIT,
+    RDW_SYNC_DATEFORMAT,
+    RECALL_SYNC_INTERVAL,
+    RECALL_SYNC_MARGIN,
+    SENSOR_FIELDS,
+    STORAGE_KEY,
+    STORAGE_SAVE_DELAY,
+    STORAGE_VERSION,
+    TOPIC_METRICS_UPDATE,
+)
+from .api import (
+    RDWClient,
+    RDWUnavailable,
+    chunks,
+)
+from .recall import RDWRecallCache
+from .vehicle import (
+    RDW_RECALL_RESOLVED,
+    RDWVehicle,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@callback
+def async_get_fleet(hass):
+    """Return the shared RDWFleet, create it if this is the first RDW entity"""
+
+    if DOMAIN not in hass.data:
+        hass.data.update({DOMAIN: {}})
+
+    if DATA_FLEET not in hass.data[DOMAIN]:
+        hass.data[DOMAIN].update({DATA_FLEET: RDWFleet(hass)})
+
+    return hass.data[DOMAIN][DATA_FLEET]
+
+
+def get_endpoints(rdw):
+    """Return the RDW datasets which are needed by the sensors of an entity"""
+
+    endpoints = list(RDW_BASE_ENDPOINTS)
+    for sensor_type in rdw.sensor_types:
+        endpoints.extend(SENSOR_FIELDS.get(sensor_type, {}))
+
+    return list(dict.fromkeys(endpoints))
+
+
+def get_select(entities, endpoint):
+    """Build the SoQL select clause with the fields needed by the sensors of the entities"""
+
+    fields = list(RDW_FIELDS[endpoint])
+    for rdw in entities:
+        for sensor_type in rdw.sensor_types:
+            fields.extend(SENSOR_FIELDS.get(sensor_type, {}).get(endpoint, []))
+
+    return ', '.join(dict.fromkeys(fields))
+
+
+class RDWLookup:
+    """Stand-in for a RDW entity, used to look up plates which aren't configured yet"""
+
+    def __init__(self, plate, sensor_types):
+
+        self.plate = plate
+        self.sensor_types = sensor_types
+        self.offline = False
+        self.vehicle = None
+        self.last_update = None
+        self.details = None
+        self.stale = False
+
+    def update_from_vehicle(self, vehicle, timestamp=None, details=None):
+        """Keep the vehicle record, None if the plate isn't registered."""
+
+        self.vehicle = vehicle
+        self.last_update = timestamp
+        self.details = details
+
+
+class RDWFleet:
+    """Batched data retrieval for all RDW entities"""
+
+    _LOGGER.debug("RDWFleet class initialized")
+
+    def __init__(self, hass, client=None):
+
+        self.hass = hass
+        self.client = client or RDWClient(async_get_clientsession(hass))
+        self._index_client = None
+        self.recalls = RDWRecallCache(self.client)
+        self.store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._data = None
+        self._load_lock = asyncio.Lock()
+        self._metadata = {}
+        self._preload = {}
+        self._pending = {}
+        self._flush = None
+        self._inflight = {}
+        self._recall_sync = {}
+
+        _LOGGER.debug("RDWFleet::__init__ called")
+
+    @property
+    def index_client(self):
+        """Return the client of the local RDW index. The index (and sqlite3) is only
+        loaded when it's used by a car with the offline option or the import_dataset service."""
+
+        if self._index_client is None:
+            from .index import (
+                RDWIndex,
+                RDWIndexClient,
+            )
+
+            self._index_client = RDWIndexClient(self.hass, RDWIndex(self.hass.config.path(INDEX_FILENAME)))
+
+        return self._index_client
+
+    @property
+    def index(self):
+        """Return the local RDW index."""
+        return self.index_client.index
+
+    async def async_load(self):
+        """Load the last good data of all plates from the persistent store."""
+
+        async with self._load_lock:
+            if self._data is None:
+                self._data = await self.store.async_load() or {}
+                _LOGGER.debug("RDWFleet::async_load loaded %d plates", len(self._data))
+
+        return self._data
+
+    async def async_restore(self, rdw):
+        """Restore the last good data of a RDW entity, return False if there is none."""
+
+        data = (await self.async_load()).get(rdw.plate)
+        if data is None or 'vehicle' not in data:
+            return False
+
+        try:
+            rdw.update_from_vehicle(
+                RDWVehicle.from_dict(data['vehicle']),
+                dt_util.parse_datetime(data['timestamp'])
+            )
+        except Exception as e:
+            _LOGGER.warning("Unable to restore stored data for %s: %s", rdw.plate, e)
+            return False
+
+        # The restored data is stale until the refresh in the background succeeds
+        rdw.stale = True
+
+        _LOGGER.debug("RDWFleet::async_restore restored %s from %s", rdw.plate, data['timestamp'])
+
+        return True
+
+    async def async_lookup(self, plates, sensor_types):
+        """Look up plates which aren't configured yet. Returns the vehicle record per plate,
+        None if the plate isn't registered or the exception if the lookup failed. The records
+        are kept for a short while, so setting up the config entry doesn't fetch them again."""
+
+        _LOGGER.debug("RDWFleet::async_lookup called for %s", plates)
+
+        lookups = [RDWLookup(plate, sensor_types) for plate in plates]
+        results = await asyncio.gather(
+            *[self.async_request_update(lookup) for lookup in lookups],
+            return_exceptions=True
+        )
+
+        for lookup, result in zip(lookups, results):
+            if not isinstance(result, Exception) and lookup.vehicle is not None:
+                self.async_preload(lookup.plate, lookup.vehicle, lookup.last_update, lookup.details)
+
+        return {
+            lookup.plate: result if isinstance(result, Exception) else lookup.vehicle
+            for lookup, result in zip(lookups, results)
+        }
+
+    @callback
+    def async_preload(self, plate, vehicle, timestamp, details=None, stale=False):
+        """Keep a vehicle record for a short while, for the (re)setup of its config entry. A
+        stale record (the last update before the reload failed) stays stale after the setup."""
+
+        self._preload[plate] = (dt_util.utcnow() + PRELOAD_TTL, vehicle, timestamp, details, stale)
+
+    @callback
+    def async_take_preload(self, rdw):
+        """Update a RDW entity from a recently retrieved vehicle record, return False if there is none."""
+
+        expires, vehicle, timestamp, details, stale = self._preload.pop(rdw.plate, (None, None, None, None, False))
+        if expires is None or expires < dt_util.utcnow():
+            return False
+
+        _LOGGER.debug("RDWFleet::async_take_preload using data of %s from %s", rdw.plate, timestamp)
+
+        rdw.update_from_vehicle(vehicle, timestamp, details)
+        rdw.stale = stale
+
+        # The data of a car which was just added isn't in the persistent store yet
+        self._async_store(rdw.plate, vehicle, timestamp)
+
+        return True
+
+    async def async_forget(self, plate):
+        """Remove the stored data of a plate."""
+
+        self._recall_sync.pop(plate, None)
+
+        if (await self.async_load()).pop(plate, None) is not None:
+            self.store.async_delay_save(lambda: self._data, STORAGE_SAVE_DELAY)
+
+    @callback
+    def _async_plan_recall_sync(self, plates, now):
+        """Split plates into plates which need all their recall rows, and plates which only need the
+        rows changed since their last sync. Returns both lists and the oldest high-water mark."""
+
+        full = []
+        incremental = []
+
+        for plate, rdws in plates.items():
+            sync = self._recall_sync.get(plate)
+
+            # A full sync also picks up recalls which were removed from the dataset
+            if sync is None or now - sync[1] >= RECALL_SYNC_INTERVAL or \
+                    any(rdw.vehicle is None for rdw in rdws):
+                full.append(plate)
+            else:
+                incremental.append(plate)
+
+        since = min((self._recall_sync[plate][0] for plate in incremental), default=None)
+
+        return full, incremental, since
+
+    @callback
+    def _async_store(self, plate, vehicle, timestamp):
+        """Keep the last good data of a plate in the persistent store. The store is loaded
+        by async_setup_entry and by every update, before any data is stored."""
+
+        # Data retrieved before the store was loaded would overwrite the other plates
+        if self._data is None:
+            _LOGGER.debug("RDWFleet::_async_store store not loaded, not storing %s", plate)
+            return
+
+        self._data[plate] = {
+            'vehicle': vehicle.as_dict(),
+            'timestamp': timestamp.isoformat(),
+        }
+        self.store.async_delay_save(lambda: self._data, STORAGE_SAVE_DELAY)
+
+    async def async_request_update(self, rdw):
+        """Queue a RDW entity for the next batched update and wait for the result."""
+
+        _LOGGER.debug("RDWFleet::async_request_update called for %s", rdw.plate)
+
+        # Join the request which is already fetching this plate, instead of queueing another one
+        if self._async_join(rdw) is not None:
+            error = (await self._async_update([rdw]))[rdw.plate]
+            if error is not None:
+                raise error
+            return True
+
+        if rdw.plate not in self._pending:
+            self._pending[rdw.plate] = ([], self.hass.loop.create_future())
+        self._pending[rdw.plate][0].append(rdw)
+
+        if self._flush is None:
+            self._flush = self.hass.async_create_task(self._async_flush(monotonic()))
+
+        return await asyncio.shield(self._pending[rdw.plate][1])
+
+    async def _async_flush(self, queued):
+        """Update all queued RDW entities in one batch."""
+
+        # Give other entities the chance to join this batch
+        await asyncio.sleep(RDW_BATCH_DELAY)
+
+        pending, self._pending, self._flush = self._pending, {}, None
+
+        tracing.record('queue', queued, monotonic(), plates=len(pending))
+
+        _LOGGER.debug("RDWFleet::_async_flush updating %d plates", len(pending))
+
+        entities = [rdw for plate in pending for rdw in pending[plate][0]]
+        try:
+            errors = await self._async_update(entities)
+        except Exception as e:
+            # The requests which wait for this batch would wait forever
+            errors = dict.fromkeys(pending, e)
+
+        for plate, (_, future) in pending.items():
+            if future.done():
+                continue
+            if errors[plate] is None:
+                future.set_result(True)
+            else:
+                future.set_exception(errors[plate])
+
+    async def async_get_changed(self, entities):
+        """Return the RDW entities which need an update. Entities with the skip_unchanged option
+        are skipped when none of the RDW datasets has been updated since their last update."""
+
+        result = []
+
+        for rdw in entities:
+            if not rdw.config_entry.options.get(CONF_SKIP_UNCHANGED, DEFAULT_SKIP_UNCHANGED) or rdw.last_update is None or rdw.offline:
+                result.append(rdw)
+                continue
+
+            for endpoint in get_endpoints(rdw):
+                updated = await self._async_get_rows_updated(endpoint)
+                if updated is None or updated >= rdw.last_update:
+                    result.append(rdw)
+                    break
+            else:
+                _LOGGER.debug("RDWFleet::async_get_changed skipping %s, datasets unchanged since %s", rdw.plate, rdw.last_update)
+
+        return result
+
+    async def _async_get_rows_updated(self, endpoint):
+        """Return the time the rows of an endpoint were last updated, or None if unknown."""
+
+        now = dt_util.utcnow()
+
+        if endpoint in self._metadata and now - self._metadata[endpoint][0] < RDW_METADATA_TTL:
+            return self._metadata[endpoint][1]
+
+        try:
+            metadata = await self.client.get_metadata(RDW_ENDPOINTS[endpoint]['endpoint'])
+            updated = dt_util.utc_from_timestamp(metadata['rowsUpdatedAt'])
+        except RDWUnavailable:
+            return None
+        except Exception as e:
+            _LOGGER.warning("Unable to get metadata from endpoint %s: %s", RDW_ENDPOINTS[endpoint]['endpoint'], e)
+            return None
+
+        _LOGGER.debug("RDWFleet::_async_get_rows_updated endpoint %s last updated at %s", RDW_ENDPOINTS[endpoint]['endpoint'], updated)
+
+        self._metadata[endpoint] = (now, updated)
+
+        return updated
+
+    async def async_update(self, entities):
+        """Update RDW entities using batched queries, return the result per plate."""
+
+        _LOGGER.debug("RDWFleet::async_update called for %d entities", len(entities))
+
+        errors = await self._async_update(entities)
+
+        for plate, error in errors.items():
+            if isinstance(error, RDWUnavailable):
+                # The circuit breaker already logged the outage
+                _LOGGER.debug("RDWFleet::async_update serving stale data for %s: %s", plate, error)
+            elif error is not None:
+                _LOGGER.warning("Unable to update data from RDW for %s: %s", plate, error)
+
+        return {plate: error is None for plate, error in errors.items()}
+
+    @callback
+    def _async_join(self, rdw):
+        """Return the future of the in-flight update of a plate, or None if there is none
+        or it doesn't fetch all the datasets used by the RDW entity."""
+
+        offline, endpoints, future = self._inflight.get(rdw.plate, (None, None, None))
+        if future is None or offline != rdw.offline or not endpoints.issuperset(get_endpoints(rdw)):
+            return None
+
+        return future
+
+    async def _async_update(self, entities):
+        """Fetch and distribute the data, return the error (or None) per plate. Plates which
+        are already being fetched join the in-flight request, and plates which are queued for
+        the next batch join that batch, instead of starting another request."""
+
+        joined = {}
+        queued = {}
+        fetch = []
+        for rdw in entities:
+            future = self._async_join(rdw)
+            if future is not None:
+                joined.setdefault(rdw.plate, (future, []))[1].append(rdw)
+            elif rdw.plate in self._pending:
+                # The batch also fetches the datasets of the entities which join it
+                if rdw not in self._pending[rdw.plate][0]:
+                    self._pending[rdw.plate][0].append(rdw)
+                queued[rdw.plate] = self._pending[rdw.plate][1]
+            else:
+                fetch.append(rdw)
+
+        # Register the plates which are fetched, so later requests can join them
+        inflight = {}
+        for rdw in fetch:
+            if rdw.plate not in inflight:
+                inflight[rdw.plate] = (rdw.offline, set(), self.hass.loop.create_future())
+            inflight[rdw.plate][1].update(get_endpoints(rdw))
+        self._inflight.update(inflight)
+
+        vehicles = {}
+        errors = {}
+
+        try:
+            # The fetched data is kept in the persistent store, so it has to be loaded first. The
+            # plates are registered as in-flight before, so there's no moment they can't be joined
+            await self.async_load()
+
+            errors.update(await self._async_update_entities(
+                [rdw for rdw in fetch if not rdw.offline],
+                self.client,
+                vehicles
+            ))
+            offline = [rdw for rdw in fetch if rdw.offline]
+            if offline:
+                errors.update(await self._async_update_entities(offline, self.index_client, vehicles))
+        except Exception as e:
+            for plate in inflight:
+                if plate not in vehicles and errors.get(plate) is None:
+                    errors[plate] = e
+            raise
+        finally:
+            # Hand the result to the requests which joined, an error is passed as result
+            for plate, (_, _, future) in inflight.items():
+                if self._inflight.get(plate) is inflight[plate]:
+                    del self._inflight[plate]
+
+                if errors.get(plate) is not None:
+                    future.set_result(errors[plate])
+                elif plate in vehicles:
+                    future.set_result(vehicles[plate])
+                else:
+                    future.cancel()
+
+        for plate, future in queued.items():
+            _LOGGER.debug("RDWFleet::_async_update joining the queued update of %s", plate)
+
+            try:
+                with tracing.span('queue', plate=plate):
+                    await asyncio.shield(future)
+            except Exception as e:
+                errors[plate] = e
+            else:
+                errors.setdefault(plate, None)
+
+        for plate, (future, rdws) in joined.items():
+            _LOGGER.debug("RDWFleet::_async_update joining the in-flight update of %s", plate)
+
+            with tracing.span('queue', plate=plate):
+                result = await asyncio.shield(future)
+            errors.setdefault(plate, None)
+
+            for rdw in rdws:
+                try:
+                    if isinstance(result, Exception):
+                        raise result
+                    rdw.update_from_vehicle(*result)
+                except Exception as e:
+                    errors[plate] = e
+
+        # Entities which couldn't be updated keep their last good data, marked as stale
+        for rdw in entities:
+            if errors.get(rdw.plate) is not None:
+                rdw.stale = True
+
+        # Update the diagnostic sensors of the RDW API
+        async_dispatcher_send(self.hass, TOPIC_METRICS_UPDATE)
+
+        return errors
+
+    async def _async_update_entities(self, entities, client, vehicles):
+        """Fetch the data using the given client, return the error (or None) per plate.
+        The parsed vehicle record of each plate is added to vehicles."""
+
+        plates = {}
+        for rdw in entities:
+            plates.setdefault(rdw.plate, []).append(rdw)
+
+        errors = {}
+
+        for chunk in chunks(list(plates), RDW_BATCH_SIZE):
+            # Only request the datasets and fields which are used by the enabled sensors
+            endpoints = {}
+            for plate in chunk:
+                for rdw in plates[plate]:
+                    for endpoint in get_endpoints(rdw):
+                        endpoints.setdefault(endpoint, {}).setdefault(plate, []).append(rdw)
+
+            started = dt_util.utcnow()
+            fetches = {}
+            incremental = []
+
+            for endpoint in endpoints:
+                select = get_select([rdw for rdws in endpoints[endpoint].values() for rdw in rdws], endpoint)
+
+                if endpoint != 'recall' or client is not self.client:
+                    fetches[endpoint] = self._async_fetch(client, endpoint, list(endpoints[endpoint]), select)
+                    continue
+
+                # Recalls change rarely, so plates with known recalls only request the rows which changed since their last sync
+                full, incremental, since = self._async_plan_recall_sync(endpoints[endpoint], started)
+                if full:
+                    fetches['recall'] = self._async_fetch(client, endpoint, full, select)
+                if incremental:
+                    fetches['recall_changes'] = self._async_fetch(
+                        client,
+                        endpoint,
+                        incremental,
+                        select,
+                        where=":updated_at > '{}'".format(since.strftime(RDW_SYNC_DATEFORMAT))
+                    )
+
+            try:
+                with tracing.span('fetch', plates=len(chunk), endpoints=list(fetches)):
+                    results = await asyncio.gather(*fetches.values())
+            except Exception as e:
+                errors.update(dict.fromkeys(chunk, e))
+                continue
+
+            results = dict(zip(fetches, results))
+            apkdata = results.get('apk', {})
+            recalldata = results.get('recall', {})
+            recalldata.update(results.get('recall_changes', {}))
+
+            # The recalls of the incremental plates are the known recalls, updated with the changed rows
+            known = {plate: endpoints['recall'][plate][0].vehicle.recalls for plate in incremental}
+
+            # Keep the high-water mark of each plate, with a margin for rows which were updated during the sync
+            for plate in chunk:
+                if client is self.client and plate in endpoints.get('recall', {}):
+                    self._recall_sync[plate] = (
+                        started - RECALL_SYNC_MARGIN,
+                        self._recall_sync[plate][1] if plate in known else started
+                    )
+                else:
+                    self._recall_sync.pop(plate, None)
+
+            # Enrich the open recalls with the details of their recall campaign
+            references = [
+                row['referentiecode_rdw']
+                for rows in recalldata.values()
+                for row in rows
+                if row.get('code_status') != RDW_RECALL_RESOLVED
+            ] + [
+                reference
+                for recalls in known.values()
+                for reference, status in recalls.items()
+                if status != RDW_RECALL_RESOLVED
+            ]
+            try:
+                with tracing.span('recall_details', references=len(references)):
+                    details = await self.recalls.async_get(references) if client is self.client else {}
+            except Exception as e:
+                _LOGGER.warning("Unable to update recall details: %s", e)
+                details = {}
+
+            timestamp = dt_util.utcnow()
+
+            with tracing.span('distribute', plates=len(chunk)):
+                for plate in chunk:
+                    errors[plate] = None
+
+                    # The rows are parsed once per plate, and the raw rows are dropped afterwards
+                    try:
+                        vehicle = RDWVehicle.from_rows(apkdata.get(plate, []), recalldata.get(plate, []), known.get(plate))
+                    except Exception as e:
+                        errors[plate] = e
+                        continue
+
+                    vehicles[plate] = (vehicle, timestamp, details)
+
+                    for rdw in plates[plate]:
+                        try:
+                            rdw.update_from_vehicle(vehicle, timestamp, details)
+                        except Exception as e:
+                            errors[plate] = e
+
+                    # Lookups of plates which aren't configured aren't stored
+                    if errors[plate] is None and vehicle is not None and \
+                            not all(isinstance(rdw, RDWLookup) for rdw in plates[plate]):
+                        self._async_store(plate, vehicle, timestamp)
+
+        return errors
+
+    async def _async_fetch(self, client, endpoint, plates, select, where=None):
+        """Fetch the rows of an endpoint for a list of plates, grouped by plate."""
+
+        rdwfilter = RDW_ENDPOINTS[endpoint]['rdwfilter']
+        kwargs = {rdwfilter: plates}
+        if where is not None:
+            kwargs['where'] = where
+
+        rows = await client.get(
+            RDW_ENDPOINTS[endpoint]['endpoint'],
+            select=select,
+            limit=RDW_QUERY_LIMIT,
+            **kwargs
+        )
+
+        _LOGGER.debug("RDWFleet::_async_fetch endpoint %s returned %d rows for %d plates", RDW_ENDPOINTS[endpoint]['endpoint'], len(rows), len(plates))
+
+        result = {}
+        for row in rows:
+            result.setdefault(row.get(rdwfilter), []).append(row)
+
+        return result
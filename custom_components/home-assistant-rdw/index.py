@@ -0,0 +1,139 @@
+"""
+RDW index - Eelco Huininga 2019-2020
+Local SQLite index of the RDW datasets, built from a CSV export of the RDW
+Open Data portal. Cars with the offline option are looked up in this index
+instead of calling the RDW Open Data API.
+"""
+
+from contextlib import closing
+import csv
+import logging
+import re
+import sqlite3
+from time import monotonic
+
+from . import tracing
+from .const import (
+    INDEX_BATCH_SIZE,
+    INDEX_COLUMNS,
+    RDW_ENDPOINTS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def normalize_column(name):
+    """Convert a column header of a CSV export to the field name used by the API"""
+
+    return re.sub(r'[^a-z0-9]+', '_', name.strip().lower()).strip('_')
+
+
+def normalize_value(column, value):
+    """Convert a value of a CSV export to the format used by the API"""
+
+    value = value.strip()
+
+    # Dates are exported as dd/mm/yyyy, the API uses yyyymmdd
+    if column.startswith('vervaldatum') and re.match(r'^\d{2}/\d{2}/\d{4}$', value):
+        return value[6:10] + value[3:5] + value[0:2]
+
+    return value
+
+
+class RDWIndex:
+    """Local SQLite index of the RDW datasets"""
+
+    _LOGGER.debug("RDWIndex class initialized")
+
+    def __init__(self, path):
+
+        self.path = path
+
+        _LOGGER.debug("RDWIndex::__init__ called path=%s", path)
+
+    def import_csv(self, dataset, filename):
+        """Build the index of a dataset from a CSV export. The file is streamed into
+        the database in batches, so memory usage doesn't depend on the size of the export."""
+
+        _LOGGER.debug("RDWIndex::import_csv dataset=%s filename=%s", dataset, filename)
+
+        columns = INDEX_COLUMNS[dataset]
+        count = 0
+
+        with closing(sqlite3.connect(self.path)) as connection, connection, open(filename, newline='', encoding='utf-8-sig') as csvfile:
+            reader = csv.reader(csvfile)
+            header = [normalize_column(name) for name in next(reader)]
+
+            missing = [column for column in columns if column not in header]
+            if missing:
+                raise ValueError('Column(s) {} not found in {}'.format(', '.join(missing), filename))
+
+            positions = [header.index(column) for column in columns]
+
+            # Build a new table and swap it with the old one, so lookups keep working during the import
+            connection.execute('DROP TABLE IF EXISTS {}_import'.format(dataset))
+            connection.execute('CREATE TABLE {}_import ({})'.format(dataset, ', '.join('{} TEXT'.format(column) for column in columns)))
+
+            insert = 'INSERT INTO {}_import VALUES ({})'.format(dataset, ', '.join('?' for column in columns))
+            batch = []
+
+            for row in reader:
+                batch.append([normalize_value(column, row[position]) for column, position in zip(columns, positions)])
+                if len(batch) >= INDEX_BATCH_SIZE:
+                    connection.executemany(insert, batch)
+                    count += len(batch)
+                    batch = []
+
+            connection.executemany(insert, batch)
+            count += len(batch)
+
+            connection.execute('DROP TABLE IF EXISTS {}'.format(dataset))
+            connection.execute('ALTER TABLE {0}_import RENAME TO {0}'.format(dataset))
+            connection.execute('CREATE INDEX {0}_kenteken ON {0} (kenteken)'.format(dataset))
+
+        _LOGGER.debug("RDWIndex::import_csv imported %d rows into %s", count, dataset)
+
+        return count
+
+    def lookup(self, dataset, plates):
+        """Return the rows of a dataset for a list of plates."""
+
+        with closing(sqlite3.connect(self.path)) as connection:
+            connection.row_factory = sqlite3.Row
+            cursor = connection.execute(
+                'SELECT * FROM {} WHERE kenteken IN ({})'.format(dataset, ', '.join('?' for plate in plates)),
+                list(plates)
+            )
+            return [dict(row) for row in cursor]
+
+
+class RDWIndexClient:
+    """Client for the local RDW index, shaped like the RDWClient"""
+
+    _LOGGER.debug("RDWIndexClient class initialized")
+
+    def __init__(self, hass, index):
+
+        self.hass = hass
+        self.index = index
+
+    async def get(self, dataset_identifier, select=None, limit=None, kenteken=None):
+        """Get the rows of a dataset for one or more plates. The index only contains the
+        fields used by the sensors, so the select clause is ignored."""
+
+        dataset = next(key for key in INDEX_COLUMNS if RDW_ENDPOINTS[key]['endpoint'] == dataset_identifier)
+        plates = kenteken if isinstance(kenteken, (list, tuple, set)) else [kenteken]
+
+        submitted = monotonic()
+
+        def lookup():
+            started = monotonic()
+            return started, self.index.lookup(dataset, plates)
+
+        started, rows = await self.hass.async_add_executor_job(lookup)
+
+        # Time spent waiting for a free executor thread, and the lookup itself
+        tracing.record('executor_wait', submitted, started, dataset=dataset)
+        tracing.record('index_lookup', started, monotonic(), dataset=dataset, rows=len(rows))
+
+        return rows
@@ -0,0 +1,21 @@
+"""
+RDW plate - Eelco Huininga 2019-2020
+Validation of Dutch license plates. Kept apart from the RDW entity, so the
+config flow can validate plates without loading the data retrieval code.
+"""
+
+
+def normalize_plate(plate):
+    """Convert a plate to the format used by the RDW: uppercase, without dashes and spaces"""
+
+    return "".join(plate.upper().replace("-", "").split())
+
+
+def validate_plate(plate):
+    """Check if the format of the user input is correct"""
+
+    if len(plate) == 6:
+        if plate.isalnum():
+            return True
+
+    return False
@@ -0,0 +1,92 @@
+"""
+RDW recall - Eelco Huininga 2019-2020
+Cache for the details of recall campaigns. Many cars share the same recall
+campaign, so the details are retrieved once per campaign (referentiecode_rdw)
+and shared between all plates.
+"""
+
+import asyncio
+from collections import OrderedDict
+import logging
+
+import homeassistant.util.dt as dt_util
+
+from .api import chunks
+from .const import (
+    RDW_BATCH_SIZE,
+    RDW_ENDPOINTS,
+    RDW_QUERY_LIMIT,
+    RECALL_CACHE_SIZE,
+    RECALL_CACHE_TTL,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Endpoints which contain the details of a recall campaign
+RECALL_DETAIL_ENDPOINTS = ('recall_details', 'recall_risk', 'recall_inform_owner')
+
+
+class RDWRecallCache:
+    """Bounded TTL/LRU cache of recall campaign details, shared by all plates"""
+
+    _LOGGER.debug("RDWRecallCache class initialized")
+
+    def __init__(self, client, size=RECALL_CACHE_SIZE, ttl=RECALL_CACHE_TTL):
+
+        self.client = client
+        self.size = size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+
+        _LOGGER.debug("RDWRecallCache::__init__ called size=%d ttl=%s", size, ttl)
+
+    async def async_get(self, references):
+        """Return the details of the given recall campaigns, fetching the ones which are not cached."""
+
+        now = dt_util.utcnow()
+        missing = []
+
+        for reference in dict.fromkeys(references):
+            if reference in self._cache and now - self._cache[reference][0] < self.ttl:
+                self._cache.move_to_end(reference)
+            else:
+                missing.append(reference)
+
+        if missing:
+            _LOGGER.debug("RDWRecallCache::async_get fetching %d recall campaigns", len(missing))
+
+            for chunk in chunks(missing, RDW_BATCH_SIZE):
+                details = await self._async_fetch(chunk)
+                for reference in chunk:
+                    self._cache[reference] = (now, details.get(reference, {}))
+                    self._cache.move_to_end(reference)
+
+            while len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+
+        return {
+            reference: self._cache[reference][1]
+            for reference in references
+            if reference in self._cache
+        }
+
+    async def _async_fetch(self, references):
+        """Fetch the details of a list of recall campaigns from all detail endpoints."""
+
+        results = await asyncio.gather(*[
+            self.client.get(
+                RDW_ENDPOINTS[endpoint]['endpoint'],
+                limit=RDW_QUERY_LIMIT,
+                **{RDW_ENDPOINTS[endpoint]['rdwfilter']: references}
+            )
+            for endpoint in RECALL_DETAIL_ENDPOINTS
+        ])
+
+        details = {}
+        for endpoint, rows in zip(RECALL_DETAIL_ENDPOINTS, results):
+            rdwfilter = RDW_ENDPOINTS[endpoint]['rdwfilter']
+            for row in rows:
+                row = dict(row)
+                details.setdefault(row.pop(rdwfilter, None), {}).update(row)
+
+        return details
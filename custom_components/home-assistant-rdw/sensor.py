@@ -18,16 +18,31 @@ from homeassistant.const import (
 from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_track_time_change
 
 
+from . import tracing
+from .aggregate import async_get_aggregate
 from .const import (
+    ATTR_APK_VALID,
+    ATTR_LAST_UPDATE,
+    ATTR_STALE,
     ATTRIBUTION,
     CONF_PLATE,
+    DATA_DIAGNOSTICS,
+    DATA_SENSOR_PLATFORMS,
     DEFAULT_ATTRIBUTION,
+    DEFAULT_NAME,
     DOMAIN,
+    FLEET_EXPIRY_WINDOW,
+    FLEET_SENSOR_TYPES,
+    RDW_ENDPOINTS,
     SENSOR_TYPES,
     TOPIC_DATA_UPDATE,
+    TOPIC_FLEET_UPDATE,
+    TOPIC_METRICS_UPDATE,
 )
+from .fleet import async_get_fleet
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -50,6 +65,38 @@ async def async_setup_entry(hass, entry, async_add_entities):
 
     async_add_entities(sensors, True)
 
+    # Keep the platform, so the sensors of the RDW device can be moved to it when their config entry is unloaded
+    hass.data[DOMAIN].setdefault(DATA_SENSOR_PLATFORMS, {})[entry.entry_id] = async_add_entities
+    async_add_domain_sensors(hass)
+
+
+@callback
+def async_add_domain_sensors(hass):
+    """Add the fleet sensors and the diagnostic sensors of the RDW API to the RDW device.
+
+    These sensors aren't linked to a car, and are added only once to the sensor platform of
+    one of the loaded config entries. If that config entry is unloaded, they are added to the
+    sensor platform of another loaded config entry."""
+
+    platforms = hass.data[DOMAIN].get(DATA_SENSOR_PLATFORMS)
+    if DATA_DIAGNOSTICS in hass.data[DOMAIN] or not platforms:
+        return
+
+    entry_id, async_add_entities = next(iter(platforms.items()))
+    hass.data[DOMAIN][DATA_DIAGNOSTICS] = entry_id
+
+    _LOGGER.debug("async_add_domain_sensors: entry=%s", entry_id)
+
+    sensors = []
+    for sensor_type in FLEET_SENSOR_TYPES:
+        _LOGGER.debug("async_add_domain_sensors: setup fleet sensor %s", sensor_type)
+        sensors.append(RDWFleetSensor(async_get_aggregate(hass), sensor_type))
+    for endpoint in RDW_ENDPOINTS:
+        _LOGGER.debug("async_add_domain_sensors: setup diagnostics for endpoint %s", endpoint)
+        sensors.append(RDWEndpointSensor(async_get_fleet(hass).client, endpoint))
+
+    async_add_entities(sensors, True)
+
 
 class RDWSensor(Entity):
     """Representation of a RDW Sensor."""
@@ -68,6 +115,7 @@ class RDWSensor(Entity):
         self._plate = plate
         self._icon = SENSOR_TYPES[sensor_type][1]
         self._state = None
+        self._attributes = {}
         self._unit_of_measurement = None
         self._unique_id = '{}_{}_{}'.format(DOMAIN, self._plate, self._sensor_type)
 
@@ -92,7 +140,10 @@ class RDWSensor(Entity):
         attributes = {
             ATTR_ATTRIBUTION: ATTRIBUTION,
             ATTR_ID: f"nl_{self._plate.lower()}",
+            ATTR_LAST_UPDATE: self._data.last_update.isoformat() if self._data.last_update else None,
+            ATTR_STALE: self._data.stale,
         }
+        attributes.update(self._attributes)
 
         return attributes
 
@@ -136,15 +187,22 @@ class RDWSensor(Entity):
 
         if self._sensor_type == 'expdate':
             self._state = await self._data.get_apk_date()
-            if not await self._data.is_apk_valid():
-                self._icon = SENSOR_TYPES['expdate'][2]
+            valid = await self._data.is_apk_valid()
+            self._attributes = {ATTR_APK_VALID: valid}
+            self._icon = SENSOR_TYPES['expdate'][1] if valid else SENSOR_TYPES['expdate'][2]
 
         elif self._sensor_type == 'recall':
             if self._data.recall is not None:
                 self._state = self._data.recall
                 self._attributes = self._data.attrs
-                if self.state > 0:
-                    self._icon = SENSOR_TYPES['recall'][2]
+                self._icon = SENSOR_TYPES['recall'][2] if self.state > 0 else SENSOR_TYPES['recall'][1]
+
+    async def _async_refresh(self):
+        """Update the sensor and write its state."""
+
+        with tracing.span('state_write', entity_id=self.entity_id):
+            await self.async_update()
+            self.async_write_ha_state()
 
     async def async_added_to_hass(self):
         """Register callbacks."""
@@ -157,12 +215,11 @@ class RDWSensor(Entity):
 
             _LOGGER.debug("RDWSensor::async_added_to_hass::update plate=%s sensor=%s", self._plate, self._sensor_type)
 
-            self.hass.async_create_task(self.async_update())
-            self.async_schedule_update_ha_state(False)
+            tracing.track(self.hass.async_create_task(self._async_refresh()))
 
         self._async_unsub_dispatcher_connect = async_dispatcher_connect(
             self.hass,
-            TOPIC_DATA_UPDATE,
+            f"{TOPIC_DATA_UPDATE}_{self._plate}",
             update
         )
 
@@ -174,3 +231,194 @@ class RDWSensor(Entity):
         if self._async_unsub_dispatcher_connect:
             self._async_unsub_dispatcher_connect()
 
+
+
+class RDWDomainSensor(Entity):
+    """Representation of a sensor of the RDW device, which isn't linked to a car."""
+
+    _LOGGER.debug("RDWDomainSensor class initialized")
+
+    def __init__(self, name, unique_id, topic):
+        """Initialize the sensor."""
+
+        self._name = name
+        self._unique_id = unique_id
+        self._topic = topic
+        self._async_unsub_dispatcher_connect = None
+
+    @property
+    def device_info(self):
+        """Return the device info."""
+        return {
+            "identifiers": {(DOMAIN, DOMAIN)},
+            "manufacturer": DEFAULT_NAME,
+            "name": DEFAULT_NAME,
+            "entry_type": "service",
+        }
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def should_poll(self):
+        """Return the polling requirement for this sensor."""
+        return False
+
+    @property
+    def unique_id(self):
+        """Return the unique ID of the sensor."""
+        return self._unique_id
+
+    async def async_added_to_hass(self):
+        """Register callbacks."""
+
+        _LOGGER.debug("RDWDomainSensor::async_added_to_hass name=%s", self._name)
+
+        @callback
+        def update():
+            """Update the entity."""
+            self.async_schedule_update_ha_state(False)
+
+        self._async_unsub_dispatcher_connect = async_dispatcher_connect(
+            self.hass,
+            self._topic,
+            update
+        )
+
+    async def async_will_remove_from_hass(self):
+        """Disconnect dispatcher listener when removed."""
+
+        _LOGGER.debug("RDWDomainSensor::async_will_remove_from_hass name=%s", self._name)
+
+        if self._async_unsub_dispatcher_connect:
+            self._async_unsub_dispatcher_connect()
+
+
+class RDWFleetSensor(RDWDomainSensor):
+    """Sensor with a fleet-level number of all configured cars."""
+
+    def __init__(self, aggregate, sensor_type):
+        """Initialize the sensor."""
+
+        super().__init__(
+            '{} {}'.format(DEFAULT_NAME, FLEET_SENSOR_TYPES[sensor_type][0]),
+            '{}_fleet_{}'.format(DOMAIN, sensor_type),
+            TOPIC_FLEET_UPDATE
+        )
+        self._aggregate = aggregate
+        self._sensor_type = sensor_type
+        self._async_unsub_time_change = None
+
+    @property
+    def device_state_attributes(self):
+        """Return the state attributes."""
+
+        attributes = {
+            ATTR_ATTRIBUTION: ATTRIBUTION,
+            'cars': self._aggregate.cars,
+        }
+
+        if self._sensor_type == 'apk_expiring':
+            attributes['window_days'] = FLEET_EXPIRY_WINDOW.days
+            attributes['expired'] = self._aggregate.expired
+
+        return attributes
+
+    @property
+    def icon(self):
+        """Return the mdi icon of the sensor."""
+        return FLEET_SENSOR_TYPES[self._sensor_type][1]
+
+    @property
+    def state(self):
+        """Return the fleet-level number."""
+
+        if self._sensor_type == 'apk_expiring':
+            return self._aggregate.expiring()
+        if self._sensor_type == 'uninsured':
+            return self._aggregate.uninsured
+        return self._aggregate.open_recalls
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return FLEET_SENSOR_TYPES[self._sensor_type][2]
+
+    async def async_added_to_hass(self):
+        """Register callbacks."""
+
+        await super().async_added_to_hass()
+
+        # The APK expiry window moves every day, also if none of the cars are updated
+        if self._sensor_type == 'apk_expiring':
+            @callback
+            def midnight(now):
+                """Update the entity."""
+                self.async_schedule_update_ha_state(False)
+
+            self._async_unsub_time_change = async_track_time_change(self.hass, midnight, hour=0, minute=0, second=0)
+
+    async def async_will_remove_from_hass(self):
+        """Disconnect listeners when removed."""
+
+        await super().async_will_remove_from_hass()
+
+        if self._async_unsub_time_change:
+            self._async_unsub_time_change()
+
+
+class RDWEndpointSensor(RDWDomainSensor):
+    """Diagnostic sensor with the performance counters of a RDW endpoint."""
+
+    def __init__(self, client, endpoint):
+        """Initialize the sensor."""
+
+        super().__init__(
+            '{} {} api'.format(DEFAULT_NAME, endpoint),
+            '{}_api_{}'.format(DOMAIN, endpoint),
+            TOPIC_METRICS_UPDATE
+        )
+        self._client = client
+        self._endpoint = endpoint
+
+    @property
+    def _metrics(self):
+        """Return the performance counters of the endpoint, None if it wasn't used yet."""
+        return self._client.metrics.get(RDW_ENDPOINTS[self._endpoint]['endpoint'])
+
+    @property
+    def device_state_attributes(self):
+        """Return the state attributes."""
+
+        attributes = {
+            ATTR_ATTRIBUTION: ATTRIBUTION,
+            'endpoint': RDW_ENDPOINTS[self._endpoint]['endpoint'],
+            'request_budget': round(self._client.limiter.budget, 2),
+            'circuit_breaker': self._client.breaker.state,
+        }
+
+        if self._metrics is not None:
+            attributes.update(self._metrics.as_dict())
+
+        return attributes
+
+    @property
+    def icon(self):
+        """Return the mdi icon of the sensor."""
+        return 'mdi:timer-outline'
+
+    @property
+    def state(self):
+        """Return the latency of the last request in milliseconds."""
+
+        if self._metrics is None or self._metrics.latency is None:
+            return None
+
+        return round(self._metrics.latency * 1000)
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return 'ms'
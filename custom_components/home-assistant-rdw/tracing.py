@@ -0,0 +1,178 @@
+"""
+RDW tracing - Eelco Huininga 2019-2020
+Opt-in tracing of a refresh cycle. When tracing is enabled, the refresh
+cycle records a tree of spans (queueing, rate limiting, executor wait, HTTP,
+parsing and the state writes of the sensors), which is dumped as JSON.
+"""
+
+import asyncio
+from contextlib import (
+    asynccontextmanager,
+    contextmanager,
+)
+from contextvars import ContextVar
+import json
+import logging
+from time import monotonic
+
+from homeassistant.core import callback
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    DATA_TRACER,
+    DOMAIN,
+    TRACE_FILENAME,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# The span which is currently recorded, None if the refresh cycle isn't traced
+_CURRENT_SPAN = ContextVar('rdw_current_span', default=None)
+
+
+@callback
+def async_get_tracer(hass):
+    """Return the shared RDWTracer, create it if this is the first RDW entity"""
+
+    if DOMAIN not in hass.data:
+        hass.data.update({DOMAIN: {}})
+
+    if DATA_TRACER not in hass.data[DOMAIN]:
+        hass.data[DOMAIN].update({DATA_TRACER: RDWTracer(hass)})
+
+    return hass.data[DOMAIN][DATA_TRACER]
+
+
+@contextmanager
+def span(name, **attributes):
+    """Record a span as child of the current span, if the refresh cycle is traced"""
+
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        yield None
+        return
+
+    child = RDWSpan(name, attributes, parent.root)
+    parent.children.append(child)
+    token = _CURRENT_SPAN.set(child)
+
+    try:
+        yield child
+    finally:
+        child.end = monotonic()
+        _CURRENT_SPAN.reset(token)
+
+
+def record(name, start, end, **attributes):
+    """Record a span which has already ended, if the refresh cycle is traced"""
+
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        return
+
+    child = RDWSpan(name, attributes, parent.root, start)
+    child.end = end
+    parent.children.append(child)
+
+
+def track(task):
+    """Make the traced refresh cycle wait for a task, for example the state write of a sensor"""
+
+    current = _CURRENT_SPAN.get()
+    if current is not None:
+        current.root.tasks.append(task)
+
+    return task
+
+
+class RDWSpan:
+    """A timed step of a refresh cycle"""
+
+    __slots__ = ('name', 'attributes', 'root', 'start', 'end', 'children', 'tasks')
+
+    def __init__(self, name, attributes, root=None, start=None):
+
+        self.name = name
+        self.attributes = attributes
+        self.root = root or self
+        self.start = monotonic() if start is None else start
+        self.end = None
+        self.children = []
+        self.tasks = []
+
+    def as_dict(self, origin=None):
+        """Return the span and its children, with times in milliseconds since the start of the trace."""
+
+        origin = self.start if origin is None else origin
+
+        return {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((self.end - self.start) * 1000, 3) if self.end is not None else None,
+            'attributes': self.attributes,
+            'children': [child.as_dict(origin) for child in self.children],
+        }
+
+
+class RDWTracer:
+    """Records and dumps traces of refresh cycles"""
+
+    _LOGGER.debug("RDWTracer class initialized")
+
+    def __init__(self, hass):
+
+        self.hass = hass
+        self.armed = False
+        self.last_trace = None
+
+        _LOGGER.debug("RDWTracer::__init__ called")
+
+    @callback
+    def async_arm(self):
+        """Trace the next refresh cycle."""
+
+        _LOGGER.debug("RDWTracer::async_arm called")
+
+        self.armed = True
+
+    @asynccontextmanager
+    async def async_trace(self, name, enabled=False, **attributes):
+        """Trace a refresh cycle if tracing is enabled or armed, and dump the trace afterwards."""
+
+        if not (enabled or self.armed):
+            yield None
+            return
+
+        self.armed = False
+
+        root = RDWSpan(name, attributes)
+        token = _CURRENT_SPAN.set(root)
+
+        try:
+            yield root
+        finally:
+            _CURRENT_SPAN.reset(token)
+
+            # The dispatcher wakes up the sensors from the event loop, give them the chance
+            # to start their state writes, then wait for them
+            await asyncio.sleep(0)
+            if root.tasks:
+                await asyncio.gather(*root.tasks, return_exceptions=True)
+
+            root.end = monotonic()
+
+            self.last_trace = {
+                'time': dt_util.utcnow().isoformat(),
+                'trace': root.as_dict(),
+            }
+            await self.hass.async_add_executor_job(self._write, self.last_trace)
+
+    def _write(self, trace):
+        """Write a trace to the trace file."""
+
+        path = self.hass.config.path(TRACE_FILENAME)
+
+        with open(path, 'w') as tracefile:
+            json.dump(trace, tracefile, indent=2, default=str)
+
+        _LOGGER.info("Trace of the RDW refresh cycle written to %s", path)
@@ -0,0 +1,109 @@
+"""
+RDW vehicle - Eelco Huininga 2019-2020
+Compact record of the RDW data of a car. The rows returned by the RDW API
+are parsed once per update, and only the fields used by the sensors are kept.
+"""
+
+from datetime import datetime
+import logging
+
+from .const import RDW_DATEFORMAT
+
+_LOGGER = logging.getLogger(__name__)
+
+# Values of the wam_verzekerd field
+RDW_INSURED = {
+    'Ja': True,
+    'Nee': False,
+}
+
+# Value of the code_status field of a resolved recall
+RDW_RECALL_RESOLVED = 'P'
+
+
+class RDWVehicle:
+    """Parsed RDW data of a car"""
+
+    __slots__ = ('manufacturer', 'model', 'expdate', 'insured', 'recalls')
+
+    def __init__(self, manufacturer=None, model=None, expdate=None, insured=None, recalls=None):
+
+        self.manufacturer = manufacturer
+        self.model = model
+        self.expdate = expdate
+        self.insured = insured
+        self.recalls = recalls or {}
+
+    @classmethod
+    def from_rows(cls, apkdata, recalldata, recalls=None):
+        """Parse the rows returned by the RDW API, return None if the car isn't registered. If the
+        known recalls are given, the recall rows are the changes since they were retrieved."""
+
+        if not apkdata:
+            return None
+
+        apk = apkdata[0]
+
+        # Manufacturer (Merk)
+        manufacturer = apk['merk'].title() if 'merk' in apk else None
+
+        # Model (Handelsbenaming)
+        # The RDW model field sometimes also contains the manufacturer of the car
+        model = apk['handelsbenaming'].replace(apk.get('merk', ''), '').title() if 'handelsbenaming' in apk else None
+
+        # Expire date (Vervaldatum APK)
+        try:
+            expdate = datetime.strptime(apk['vervaldatum_apk'], RDW_DATEFORMAT).date()
+        except (KeyError, ValueError):
+            expdate = None
+
+        # Insurance state (WAM Verzekerd)
+        insured = RDW_INSURED.get(apk.get('wam_verzekerd'))
+
+        # Status of each recall (Terugroepactie)
+        recalls = dict(recalls or {})
+        recalls.update({
+            recall['referentiecode_rdw']: recall.get('code_status')
+            for recall in recalldata or []
+            if 'referentiecode_rdw' in recall
+        })
+
+        return cls(manufacturer, model, expdate, insured, recalls)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restore a vehicle record from the persistent store."""
+
+        return cls(
+            data['manufacturer'],
+            data['model'],
+            datetime.strptime(data['expdate'], RDW_DATEFORMAT).date() if data['expdate'] else None,
+            data['insured'],
+            data['recalls'],
+        )
+
+    def as_dict(self):
+        """Return the vehicle record in a format for the persistent store."""
+
+        return {
+            'manufacturer': self.manufacturer,
+            'model': self.model,
+            'expdate': self.expdate.strftime(RDW_DATEFORMAT) if self.expdate else None,
+            'insured': self.insured,
+            'recalls': self.recalls,
+        }
+
+    @property
+    def name(self):
+        """Return the name of the car, based on the manufacturer and model."""
+
+        if self.manufacturer is None and self.model is None:
+            return None
+
+        return '{} {}'.format(self.manufacturer, self.model).title()
+
+    @property
+    def open_recalls(self):
+        """Return the reference codes of the recalls which aren't resolved yet."""
+
+        return [reference for reference, status in self.recalls.items() if status != RDW_RECALL_RESOLVED]
@@ -0,0 +1,10 @@
+"""Tests of the RDW integration."""
+
+import os
+import sys
+
+# Use the stand-ins for Home Assistant and aiohttp, see stubs/README.md
+STUBS_PATH = os.path.join(os.path.dirname(__file__), "stubs")
+
+if STUBS_PATH not in sys.path:
+    sys.path.insert(0, STUBS_PATH)
@@ -0,0 +1,182 @@
+"""
+RDW tests - Eelco Huininga 2019-2020
+Fleet-scale refresh benchmark. Sets up a number of config entries against the
+fake SODA API, and measures the refresh cycles of the coordinator: the
+end-to-end latency, the number of requests to the RDW, the executor jobs and
+the state writes of the entities per cycle.
+
+Run from the root of the repository:
+    python -m tests.benchmark
+    python -m tests.benchmark --entries 100 1000 --latency 0.2 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+from collections import namedtuple
+import logging
+import tempfile
+from time import monotonic
+
+from homeassistant.const import (
+    CONF_BINARY_SENSORS,
+    CONF_NAME,
+    CONF_SCAN_INTERVAL,
+    CONF_SENSORS,
+)
+
+from .common import (
+    FakeHass,
+    MockConfigEntry,
+    load_integration,
+)
+from .fake_rdw import FakeSocrata
+
+ENTRY_COUNTS = (1, 10, 100, 1000)
+
+# The rate limiter of the RDW API is disabled, unless the benchmark is run with --rate-limit
+UNLIMITED = 1e9
+
+CycleResult = namedtuple("CycleResult", ["entries", "latency", "requests", "executor_jobs", "state_writes"])
+
+
+def get_plates(count):
+    """Return a list of valid, unique plates."""
+    return ["BM{:04d}".format(number) for number in range(count)]
+
+
+def create_entry(plate, **options):
+    """Return the config entry of a car with the default sensors."""
+
+    const = load_integration().const
+
+    return MockConfigEntry(
+        {
+            const.CONF_PLATE: plate,
+            CONF_NAME: "Car {}".format(plate),
+            const.CONF_MANUFACTURER: None,
+            const.CONF_MODEL: None,
+            const.CONF_DATEFORMAT: const.DEFAULT_DATEFORMAT,
+            CONF_SCAN_INTERVAL: int(const.DEFAULT_SCAN_INTERVAL.total_seconds()),
+            CONF_SENSORS: list(const.SENSOR_DEFAULTS),
+            CONF_BINARY_SENSORS: list(const.BINARY_SENSOR_DEFAULTS),
+        },
+        options=options or None,
+        title=plate,
+        unique_id=plate,
+    )
+
+
+async def async_setup_fleet(hass, server, count, rate_limit=False, **options):
+    """Set up the integration with a config entry per car, using the fake SODA API."""
+
+    integration = load_integration()
+
+    from rdw.api import (
+        RDWClient,
+        RDWRateLimiter,
+    )
+    from rdw.fleet import RDWFleet
+
+    limiter = RDWRateLimiter() if rate_limit else RDWRateLimiter(UNLIMITED, UNLIMITED)
+    hass.data[integration.const.DOMAIN] = {
+        integration.const.DATA_FLEET: RDWFleet(hass, client=RDWClient(server, limiter=limiter)),
+    }
+
+    await integration.async_setup(hass, {})
+
+    # Home Assistant sets up the config entries concurrently
+    entries = [create_entry(plate, **options) for plate in get_plates(count)]
+    await asyncio.gather(*[hass.config_entries.async_add(entry) for entry in entries])
+    await hass.async_block_till_done()
+
+    return entries
+
+
+async def async_unload_fleet(hass, entries):
+    """Unload the config entries, which stops their timers."""
+
+    for entry in entries:
+        await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+
+async def async_refresh_cycle(hass, server, count):
+    """Refresh all cars, return the measurements of the cycle."""
+
+    from rdw.coordinator import async_get_coordinator
+
+    const = load_integration().const
+
+    requests, executor_jobs, state_writes = server.request_count, hass.executor_jobs, hass.states.writes
+    start = monotonic()
+
+    await async_get_coordinator(hass).async_refresh(const.DEFAULT_SCAN_INTERVAL)
+    await hass.async_block_till_done()
+
+    return CycleResult(
+        count,
+        monotonic() - start,
+        server.request_count - requests,
+        hass.executor_jobs - executor_jobs,
+        hass.states.writes - state_writes,
+    )
+
+
+async def async_benchmark(count, cycles=3, latency=0.0, error_rate=0.0, recall_rows=1, rate_limit=False, config_dir=None):
+    """Set up count config entries, and return the measurements of the refresh cycles. The
+    errors are only injected after the setup, so all cars have data to fall back on."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        hass = FakeHass(config_dir or tmpdir)
+        server = FakeSocrata(latency=latency, recall_rows=recall_rows)
+
+        entries = await async_setup_fleet(hass, server, count, rate_limit)
+        server.error_rate = error_rate
+
+        results = [await async_refresh_cycle(hass, server, count) for _ in range(cycles)]
+
+        await async_unload_fleet(hass, entries)
+
+    return results
+
+
+def main():
+    """Run the benchmark and print a table with the measurements per cycle."""
+
+    parser = argparse.ArgumentParser(description="Fleet-scale refresh benchmark of the RDW integration")
+    parser.add_argument("--entries", type=int, nargs="+", default=ENTRY_COUNTS, help="numbers of config entries")
+    parser.add_argument("--cycles", type=int, default=3, help="refresh cycles per number of config entries")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency of the fake RDW API in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of the requests which fail")
+    parser.add_argument("--recall-rows", type=int, default=1, help="recall rows per plate")
+    parser.add_argument("--rate-limit", action="store_true", help="use the rate limiter of the RDW API")
+    args = parser.parse_args()
+
+    # The failed requests are logged as warnings by the integration
+    logging.basicConfig(level=logging.ERROR)
+
+    print("{:>8} {:>6} {:>12} {:>9} {:>14} {:>13}".format("entries", "cycle", "latency (ms)", "requests", "executor jobs", "state writes"))
+
+    for count in args.entries:
+        results = asyncio.run(async_benchmark(
+            count,
+            cycles=args.cycles,
+            latency=args.latency,
+            error_rate=args.error_rate,
+            recall_rows=args.recall_rows,
+            rate_limit=args.rate_limit,
+        ))
+
+        for cycle, result in enumerate(results, 1):
+            print("{:>8} {:>6} {:>12.1f} {:>9} {:>14} {:>13}".format(
+                result.entries,
+                cycle,
+                result.latency * 1000,
+                result.requests,
+                result.executor_jobs,
+                result.state_writes,
+            ))
+
+
+if __name__ == "__main__":
+    main()
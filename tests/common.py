@@ -0,0 +1,402 @@
+"""
+RDW tests - Eelco Huininga 2019-2020
+Helpers of the tests: loading the integration from its directory and a
+minimal Home Assistant core, which counts the executor jobs and the state
+writes of the entities.
+"""
+
+import asyncio
+import importlib
+import importlib.util
+import os
+import re
+import sys
+import uuid
+
+from homeassistant.config_entries import (
+    ENTRY_STATE_LOADED,
+    ENTRY_STATE_NOT_LOADED,
+)
+
+INTEGRATION_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "custom_components", "home-assistant-rdw")
+
+# The integration is installed as custom_components/rdw, its directory name isn't a valid module name
+INTEGRATION = "rdw"
+
+
+def load_integration():
+    """Import the integration as the rdw package."""
+
+    if INTEGRATION in sys.modules:
+        return sys.modules[INTEGRATION]
+
+    spec = importlib.util.spec_from_file_location(
+        INTEGRATION,
+        os.path.join(INTEGRATION_PATH, "__init__.py"),
+        submodule_search_locations=[INTEGRATION_PATH]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[INTEGRATION] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def slugify(text):
+    """Return the text as a valid object ID."""
+
+    return re.sub(r"[^a-z0-9_]+", "_", str(text).lower()).strip("_")
+
+
+def async_fire_time_changed(hass, point_in_time):
+    """Run the actions which are scheduled at or before a point in time."""
+
+    from homeassistant.helpers.event import DATA_POINT_IN_TIME_LISTENERS
+
+    listeners = hass.data.get(DATA_POINT_IN_TIME_LISTENERS, [])
+    for listener in [listener for listener in listeners if listener[0] <= point_in_time]:
+        listeners.remove(listener)
+        hass.async_run_job(listener[1], point_in_time)
+
+
+class MockConfigEntry:
+    """Config entry of the RDW integration"""
+
+    def __init__(self, data, options=None, title=None, entry_id=None, unique_id=None):
+
+        self.domain = INTEGRATION
+        self.data = dict(data)
+        self.options = dict(options or {})
+        self.title = title
+        self.entry_id = entry_id or uuid.uuid4().hex
+        self.unique_id = unique_id
+        self.state = ENTRY_STATE_NOT_LOADED
+        self.update_listeners = []
+
+    def add_update_listener(self, listener):
+        """Listen for updates of the options, return the function to stop listening."""
+
+        self.update_listeners.append(listener)
+
+        return lambda: self.update_listeners.remove(listener)
+
+
+class FakeConfig:
+    """Configuration of the fake Home Assistant"""
+
+    def __init__(self, config_dir):
+
+        self.config_dir = config_dir
+        self.allowlist_external_dirs = set()
+
+    def path(self, *path):
+        """Return a path relative to the configuration directory."""
+        return os.path.join(self.config_dir, *path)
+
+    def is_allowed_path(self, path):
+        """Return True if the path is in one of the allowed directories."""
+
+        path = os.path.realpath(path)
+
+        return any(
+            os.path.commonpath([path, os.path.realpath(allowed)]) == os.path.realpath(allowed)
+            for allowed in self.allowlist_external_dirs
+        )
+
+
+class FakeStates:
+    """State machine, counts the state writes"""
+
+    def __init__(self):
+
+        self.writes = 0
+        self._states = {}
+
+    def async_entity_id(self, domain, name):
+        """Return a free entity ID for an entity name."""
+
+        entity_id = "{}.{}".format(domain, slugify(name))
+        candidate, number = entity_id, 1
+        while candidate in self._states:
+            number += 1
+            candidate = "{}_{}".format(entity_id, number)
+        self._states[candidate] = None
+
+        return candidate
+
+    def async_set(self, entity_id, state, attributes=None):
+        """Write the state of an entity."""
+
+        self.writes += 1
+        self._states[entity_id] = (state, dict(attributes or {}))
+
+    def async_remove(self, entity_id):
+        """Remove the state of an entity."""
+        self._states.pop(entity_id, None)
+
+    def get(self, entity_id):
+        """Return the state and attributes of an entity, None if it has no state."""
+        return self._states.get(entity_id)
+
+    def async_entity_ids(self, domain=None):
+        """Return the entity IDs, optionally of a single domain."""
+        return [entity_id for entity_id in self._states if domain is None or entity_id.startswith(domain + ".")]
+
+
+class FakeBus:
+    """Event bus, keeps the fired events"""
+
+    def __init__(self):
+        self.events = []
+
+    def async_fire(self, event_type, event_data=None):
+        """Fire an event."""
+        self.events.append((event_type, event_data or {}))
+
+
+class FakeServices:
+    """Service registry"""
+
+    def __init__(self, hass):
+
+        self.hass = hass
+        self._services = {}
+
+    def async_register(self, domain, service, service_func, schema=None):
+        """Register a service."""
+        self._services[(domain, service)] = (service_func, schema)
+
+    def has_service(self, domain, service):
+        """Return True if the service is registered."""
+        return (domain, service) in self._services
+
+    async def async_call(self, domain, service, service_data=None):
+        """Call a service and wait for it to finish."""
+
+        service_func, schema = self._services[(domain, service)]
+        data = schema(dict(service_data or {})) if schema is not None else dict(service_data or {})
+
+        result = service_func(FakeServiceCall(domain, service, data))
+        if asyncio.iscoroutine(result):
+            await result
+
+
+class FakeServiceCall:
+    """Call of a service"""
+
+    def __init__(self, domain, service, data):
+
+        self.domain = domain
+        self.service = service
+        self.data = data
+
+
+class FakeEntityPlatform:
+    """The entities which a config entry added to an entity domain"""
+
+    def __init__(self, hass, domain):
+
+        self.hass = hass
+        self.domain = domain
+        self.entities = []
+
+    def async_add_entities(self, entities, update_before_add=False):
+        """Add entities, the way the entity platform of Home Assistant does."""
+
+        self.hass.async_create_task(self._async_add_entities(list(entities), update_before_add))
+
+    async def _async_add_entities(self, entities, update_before_add):
+        """Add entities and write their first state."""
+
+        for entity in entities:
+            entity.hass = self.hass
+            if update_before_add:
+                await entity.async_device_update()
+            entity.entity_id = self.hass.states.async_entity_id(self.domain, entity.name)
+            self.entities.append(entity)
+
+            await entity.async_added_to_hass()
+            entity.async_write_ha_state()
+
+    async def async_reset(self):
+        """Remove all entities of the platform."""
+
+        for entity in self.entities:
+            await entity.async_will_remove_from_hass()
+            self.hass.states.async_remove(entity.entity_id)
+        self.entities = []
+
+
+class FakeFlowManager:
+    """Config flow manager, keeps the started flows"""
+
+    def __init__(self):
+        self.flows = []
+
+    async def async_init(self, handler, *, context=None, data=None):
+        """Start a config flow."""
+        self.flows.append((handler, context, data))
+
+
+class FakeConfigEntries:
+    """Config entries of the RDW integration, and the entity platforms they set up"""
+
+    def __init__(self, hass):
+
+        self.hass = hass
+        self.flow = FakeFlowManager()
+        self._entries = {}
+        self._platforms = {}
+
+    def async_entries(self, domain=None):
+        """Return the config entries."""
+        return list(self._entries.values())
+
+    def async_get_entry(self, entry_id):
+        """Return a config entry."""
+        return self._entries.get(entry_id)
+
+    def async_update_entry(self, entry, *, data=None, options=None, title=None):
+        """Update the data or options of a config entry."""
+
+        if data is not None:
+            entry.data = dict(data)
+        if options is not None:
+            entry.options = dict(options)
+        if title is not None:
+            entry.title = title
+
+    async def async_add(self, entry):
+        """Add a config entry and set it up."""
+
+        self._entries[entry.entry_id] = entry
+
+        return await self._async_setup(entry)
+
+    async def _async_setup(self, entry):
+        """Set up a config entry."""
+
+        result = await load_integration().async_setup_entry(self.hass, entry)
+        if result:
+            entry.state = ENTRY_STATE_LOADED
+
+        return result
+
+    async def async_unload(self, entry_id):
+        """Unload a config entry, if it's loaded."""
+
+        entry = self._entries[entry_id]
+        if entry.state != ENTRY_STATE_LOADED:
+            return True
+
+        result = await load_integration().async_unload_entry(self.hass, entry)
+        if result:
+            entry.state = ENTRY_STATE_NOT_LOADED
+
+        return result
+
+    async def async_remove(self, entry_id):
+        """Unload and remove a config entry."""
+
+        entry = self._entries[entry_id]
+        await self.async_unload(entry_id)
+        del self._entries[entry_id]
+
+        await load_integration().async_remove_entry(self.hass, entry)
+
+    async def async_reload(self, entry_id):
+        """Unload and set up a config entry again."""
+
+        await self.async_unload(entry_id)
+        return await self._async_setup(self._entries[entry_id])
+
+    async def async_forward_entry_setup(self, entry, domain):
+        """Set up an entity domain of a config entry."""
+
+        platform = importlib.import_module("{}.{}".format(INTEGRATION, domain))
+        entity_platform = FakeEntityPlatform(self.hass, domain)
+        self._platforms[(entry.entry_id, domain)] = entity_platform
+
+        await platform.async_setup_entry(self.hass, entry, entity_platform.async_add_entities)
+
+        return True
+
+    async def async_forward_entry_unload(self, entry, domain):
+        """Unload an entity domain of a config entry."""
+
+        entity_platform = self._platforms.pop((entry.entry_id, domain), None)
+        if entity_platform is None:
+            return False
+
+        await entity_platform.async_reset()
+
+        return True
+
+
+class FakeHass:
+    """Home Assistant core with the parts used by the RDW integration. The executor jobs
+    and the state writes are counted."""
+
+    def __init__(self, config_dir):
+
+        self.loop = asyncio.get_running_loop()
+        self.data = {}
+        self.config = FakeConfig(config_dir)
+        self.states = FakeStates()
+        self.bus = FakeBus()
+        self.services = FakeServices(self)
+        self.config_entries = FakeConfigEntries(self)
+        self.executor_jobs = 0
+        self._tasks = set()
+
+    def async_create_task(self, target):
+        """Run a coroutine as task, the task is tracked by async_block_till_done."""
+
+        task = self.loop.create_task(target)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return task
+
+    def async_add_job(self, target, *args):
+        """Run a coroutine as task, or call a callback from the event loop."""
+
+        if asyncio.iscoroutine(target):
+            return self.async_create_task(target)
+        if asyncio.iscoroutinefunction(target):
+            return self.async_create_task(target(*args))
+
+        self.loop.call_soon(target, *args)
+
+        return None
+
+    def async_run_job(self, target, *args):
+        """Run a coroutine function as task, or call a callback right away."""
+
+        if asyncio.iscoroutinefunction(target):
+            return self.async_create_task(target(*args))
+
+        target(*args)
+
+        return None
+
+    def async_add_executor_job(self, target, *args):
+        """Run a function in the executor."""
+
+        self.executor_jobs += 1
+
+        return self.loop.run_in_executor(None, target, *args)
+
+    async def async_block_till_done(self):
+        """Wait until all tasks and scheduled callbacks are done."""
+
+        while True:
+            # Let the callbacks which were scheduled with call_soon run, they may create tasks
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+
+            pending = [task for task in self._tasks if not task.done()]
+            if not pending:
+                return
+
+            await asyncio.wait(pending)
@@ -0,0 +1,82 @@
+"""Fixtures of the tests of the RDW integration."""
+
+import asyncio
+
+import pytest
+
+from .benchmark import (
+    async_refresh_cycle,
+    async_setup_fleet,
+    async_unload_fleet,
+)
+from .common import (
+    FakeHass,
+    load_integration,
+)
+from .fake_rdw import FakeSocrata
+
+
+class Harness:
+    """The fake Home Assistant and the fake RDW API of a test, with their own event loop"""
+
+    def __init__(self, config_dir):
+
+        self.loop = asyncio.new_event_loop()
+        self.const = load_integration().const
+        self.hass = self.run(self._async_create_hass(config_dir))
+        self.server = FakeSocrata()
+        self.entries = []
+
+    @staticmethod
+    async def _async_create_hass(config_dir):
+        """Create the fake Home Assistant from within the event loop."""
+        return FakeHass(config_dir)
+
+    def run(self, coro):
+        """Run a coroutine in the event loop of the test, and return its result."""
+        return self.loop.run_until_complete(coro)
+
+    def setup(self, count, **options):
+        """Set up the integration with count cars, return their config entries."""
+
+        self.entries = self.run(async_setup_fleet(self.hass, self.server, count, **options))
+
+        return self.entries
+
+    def refresh(self):
+        """Run a refresh cycle of all cars, return its measurements."""
+        return self.run(async_refresh_cycle(self.hass, self.server, len(self.entries)))
+
+    def block_till_done(self):
+        """Wait until all tasks and scheduled callbacks are done."""
+        self.run(self.hass.async_block_till_done())
+
+    def entity(self, entry):
+        """Return the RDW entity of a config entry."""
+        return self.hass.data[self.const.DOMAIN][entry.data[self.const.CONF_PLATE]]["entity"]
+
+    def states(self, text=""):
+        """Return the states of the entities which have the text in their entity ID."""
+
+        return {
+            entity_id: self.hass.states.get(entity_id)
+            for entity_id in self.hass.states.async_entity_ids()
+            if text in entity_id
+        }
+
+    def close(self):
+        """Unload the config entries, which stops their timers, and close the event loop."""
+
+        self.run(async_unload_fleet(self.hass, self.hass.config_entries.async_entries()))
+        self.loop.close()
+
+
+@pytest.fixture
+def harness(tmp_path):
+    """Return the test harness, the config entries are unloaded after the test."""
+
+    harness = Harness(str(tmp_path))
+
+    yield harness
+
+    harness.close()
@@ -0,0 +1,169 @@
+"""
+RDW tests - Eelco Huininga 2019-2020
+Local stand-in for the SODA API of the RDW. It serves the Gekentekende
+voertuigen (m9d7-ebf2) and Terugroep acties (t49b-isb7) datasets for any
+plate, with a configurable latency, error rate and number of recall rows per
+plate. It is used as the aiohttp session of RDWClient, so the rate limiter,
+circuit breaker, retries and metrics of the client are part of the tests.
+"""
+
+import asyncio
+from collections import Counter
+from datetime import (
+    date,
+    datetime,
+    timedelta,
+    timezone,
+)
+import json
+import random
+import re
+from urllib.parse import urlparse
+import zlib
+
+from aiohttp import ClientResponseError
+
+APK_DATASET = "m9d7-ebf2"
+RECALL_DATASET = "t49b-isb7"
+
+# Format of the dates in the APK dataset, and of the :updated_at system field
+APK_DATEFORMAT = "%Y%m%d"
+UPDATED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+FILTER_IN = re.compile(r"(\w+) in \(([^)]*)\)")
+FILTER_EQUALS = re.compile(r"(\w+)='([^']*)'")
+FILTER_UPDATED_AT = re.compile(r":updated_at > '([^']*)'")
+
+
+class FakeSocrata:
+    """Fake aiohttp session which answers the SODA requests of RDWClient"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, recall_rows=1, unregistered=(), retry_after=0.01, seed=0):
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.recall_rows = recall_rows
+        self.unregistered = set(unregistered)
+        self.retry_after = retry_after
+        self.updated_at = datetime.now(timezone.utc) - timedelta(days=1)
+        self.requests = Counter()
+        self.errors = 0
+        self._random = random.Random(seed)
+
+    @property
+    def request_count(self):
+        """Return the number of requests to all datasets."""
+        return sum(self.requests.values())
+
+    def get(self, url, params=None, timeout=None):
+        """Request an URL, used as 'async with session.get(...) as response'."""
+        return FakeResponse(self, url, params or {})
+
+    async def async_respond(self, url, params):
+        """Return the status, headers and body of the response to a request."""
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        path = urlparse(url).path
+        dataset = path.rsplit("/", 1)[-1][:-len(".json")]
+        self.requests[dataset] += 1
+
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            return 503, {"Retry-After": str(self.retry_after)}, b"Service Unavailable"
+
+        if path.startswith("/api/views/"):
+            return 200, {}, json.dumps({"id": dataset, "rowsUpdatedAt": int(self.updated_at.timestamp())}).encode()
+
+        return 200, {}, json.dumps(self.query(dataset, params)).encode()
+
+    def query(self, dataset, params):
+        """Return the rows of a dataset which match the SoQL clauses."""
+
+        where = params.get("$where", "")
+
+        filters = {field: [value.strip().strip("'") for value in values.split(",")] for field, values in FILTER_IN.findall(where)}
+        filters.update({field: [value] for field, value in FILTER_EQUALS.findall(where)})
+
+        rows = [
+            row
+            for field, values in filters.items()
+            for value in values
+            for row in self.rows(dataset, field, value)
+        ]
+
+        # None of the rows changed after they were created
+        since = FILTER_UPDATED_AT.search(where)
+        if since is not None and self.updated_at.strftime(UPDATED_AT_FORMAT) <= since.group(1):
+            rows = []
+
+        if "$select" in params:
+            fields = [field.strip() for field in params["$select"].split(",")]
+            rows = [{field: row[field] for field in fields if field in row} for row in rows]
+
+        if "$limit" in params:
+            rows = rows[:int(params["$limit"])]
+
+        return rows
+
+    def rows(self, dataset, field, value):
+        """Return the rows of a plate, the data is derived from a hash of the plate."""
+
+        if field != "kenteken" or value in self.unregistered:
+            return []
+
+        seed = zlib.crc32(value.encode())
+
+        if dataset == APK_DATASET:
+            return [{
+                "kenteken": value,
+                "merk": "VOLKSWAGEN",
+                "handelsbenaming": "GOLF",
+                "vervaldatum_apk": (date.today() + timedelta(days=seed % 730 - 60)).strftime(APK_DATEFORMAT),
+                "wam_verzekerd": "Nee" if seed % 20 == 0 else "Ja",
+            }]
+
+        if dataset == RECALL_DATASET:
+            return [
+                {
+                    "kenteken": value,
+                    "referentiecode_rdw": "RC{:04d}".format((seed + number) % 1000),
+                    "code_status": "O" if (seed + number) % 4 == 0 else "P",
+                }
+                for number in range(self.recall_rows)
+            ]
+
+        return []
+
+
+class FakeResponse:
+    """Response to a request of the fake SODA API"""
+
+    def __init__(self, server, url, params):
+
+        self._server = server
+        self._url = url
+        self._params = params
+        self._body = None
+        self.status = None
+        self.headers = {}
+
+    async def __aenter__(self):
+
+        self.status, self.headers, self._body = await self._server.async_respond(self._url, self._params)
+
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    def raise_for_status(self):
+        """Raise ClientResponseError if the status is an error."""
+
+        if self.status >= 400:
+            raise ClientResponseError(None, (), status=self.status, message=self._body.decode(), headers=self.headers)
+
+    async def read(self):
+        """Return the body of the response."""
+        return self._body
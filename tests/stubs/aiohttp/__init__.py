@@ -0,0 +1,30 @@
+"""Stand-in for aiohttp, only the parts used by the RDW integration. The tests
+use a fake session, so no HTTP requests are made."""
+
+
+class ClientError(Exception):
+    """Base class for client errors."""
+
+
+class ClientResponseError(ClientError):
+    """Error of a response with an error status."""
+
+    def __init__(self, request_info, history, *, status=None, message="", headers=None):
+
+        super().__init__("{}, message={!r}".format(status, message))
+        self.request_info = request_info
+        self.history = history
+        self.status = status
+        self.message = message
+        self.headers = headers
+
+
+class ClientTimeout:
+    """Timeouts of a request."""
+
+    def __init__(self, total=None, connect=None, sock_read=None, sock_connect=None):
+
+        self.total = total
+        self.connect = connect
+        self.sock_read = sock_read
+        self.sock_connect = sock_connect
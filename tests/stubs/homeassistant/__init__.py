@@ -0,0 +1 @@
+"""Stand-in for Home Assistant, only the parts used by the RDW integration."""
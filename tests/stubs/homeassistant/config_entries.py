@@ -0,0 +1,105 @@
+"""Stand-in for homeassistant.config_entries."""
+
+SOURCE_IMPORT = "import"
+SOURCE_USER = "user"
+
+CONN_CLASS_CLOUD_POLL = "cloud_poll"
+
+ENTRY_STATE_LOADED = "loaded"
+ENTRY_STATE_NOT_LOADED = "not_loaded"
+
+
+class Registry(dict):
+    """Registry of the config flow handlers."""
+
+    def register(self, domain):
+        """Register a config flow handler of a domain."""
+
+        def decorator(handler):
+            self[domain] = handler
+            return handler
+
+        return decorator
+
+
+HANDLERS = Registry()
+
+
+class AbortFlow(Exception):
+    """Abort the config flow."""
+
+    def __init__(self, reason):
+
+        super().__init__(reason)
+        self.reason = reason
+
+
+class FlowHandler:
+    """Handle the steps of a flow."""
+
+    hass = None
+    context = None
+    flow_id = None
+
+    def async_show_form(self, *, step_id, data_schema=None, errors=None, description_placeholders=None):
+        """Return the definition of a form."""
+
+        return {
+            "type": "form",
+            "step_id": step_id,
+            "data_schema": data_schema,
+            "errors": errors,
+            "description_placeholders": description_placeholders,
+        }
+
+    def async_create_entry(self, *, title, data, description_placeholders=None):
+        """Return the definition of a new config entry."""
+
+        return {
+            "type": "create_entry",
+            "title": title,
+            "data": data,
+            "description_placeholders": description_placeholders,
+        }
+
+    def async_abort(self, *, reason, description_placeholders=None):
+        """Return the definition of an aborted flow."""
+
+        return {
+            "type": "abort",
+            "reason": reason,
+            "description_placeholders": description_placeholders,
+        }
+
+
+class ConfigFlow(FlowHandler):
+    """Base class for config flows."""
+
+    unique_id = None
+
+    async def async_set_unique_id(self, unique_id, *, raise_on_progress=True):
+        """Set the unique ID of the config flow."""
+
+        self.unique_id = unique_id
+
+    def _async_current_entries(self):
+        """Return the config entries of the domain."""
+
+        if self.hass is None:
+            return []
+
+        return self.hass.config_entries.async_entries()
+
+    def _abort_if_unique_id_configured(self):
+        """Abort if the unique ID is already configured."""
+
+        if self.hass is None:
+            return
+
+        for entry in self.hass.config_entries.async_entries():
+            if entry.unique_id == self.unique_id:
+                raise AbortFlow("already_configured")
+
+
+class OptionsFlow(FlowHandler):
+    """Base class for options flows."""
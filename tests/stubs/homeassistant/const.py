@@ -0,0 +1,11 @@
+"""Constants used by the RDW integration."""
+
+ATTR_ATTRIBUTION = "attribution"
+ATTR_ID = "id"
+
+CONF_BINARY_SENSORS = "binary_sensors"
+CONF_NAME = "name"
+CONF_SCAN_INTERVAL = "scan_interval"
+CONF_SENSORS = "sensors"
+
+STATE_UNKNOWN = "unknown"
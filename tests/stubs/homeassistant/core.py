@@ -0,0 +1,14 @@
+"""Stand-in for homeassistant.core."""
+
+
+def callback(func):
+    """Mark a function as safe to call from within the event loop."""
+
+    setattr(func, "_hass_callback", True)
+    return func
+
+
+def is_callback(func):
+    """Return True if the function is marked as a callback."""
+
+    return getattr(func, "_hass_callback", False) is True
@@ -0,0 +1,9 @@
+"""Stand-in for homeassistant.exceptions."""
+
+
+class HomeAssistantError(Exception):
+    """General Home Assistant exception occurred."""
+
+
+class PlatformNotReady(HomeAssistantError):
+    """Error to indicate that platform is not ready."""
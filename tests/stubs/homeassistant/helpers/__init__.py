@@ -0,0 +1 @@
+"""Stand-in for homeassistant.helpers."""
@@ -0,0 +1,9 @@
+"""Stand-in for homeassistant.helpers.aiohttp_client."""
+
+DATA_CLIENTSESSION = "aiohttp_clientsession"
+
+
+def async_get_clientsession(hass):
+    """Return the shared client session, the tests put a fake session in hass.data."""
+
+    return hass.data.get(DATA_CLIENTSESSION)
@@ -0,0 +1,45 @@
+"""Stand-in for homeassistant.helpers.config_validation."""
+
+from datetime import timedelta
+import os
+
+import voluptuous as vol
+
+
+def ensure_list(value):
+    """Wrap value in list if it is not one."""
+
+    if value is None:
+        return []
+
+    return value if isinstance(value, list) else [value]
+
+
+def string(value):
+    """Coerce value to string, except for None."""
+
+    if value is None:
+        raise vol.Invalid("string value is None")
+
+    return str(value)
+
+
+def isfile(value):
+    """Validate that the value is an existing file."""
+
+    if value is None or not os.path.isfile(value):
+        raise vol.Invalid("not a file")
+
+    return value
+
+
+def time_period(value):
+    """Validate and transform a time period, in seconds or as timedelta."""
+
+    if isinstance(value, timedelta):
+        return value
+
+    try:
+        return timedelta(seconds=int(value))
+    except (TypeError, ValueError) as e:
+        raise vol.Invalid("expected a time period") from e
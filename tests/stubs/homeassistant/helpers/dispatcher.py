@@ -0,0 +1,25 @@
+"""Stand-in for homeassistant.helpers.dispatcher."""
+
+DATA_DISPATCHER = "dispatcher"
+
+
+def async_dispatcher_connect(hass, signal, target):
+    """Connect a callable function to a signal, return the function to disconnect it."""
+
+    targets = hass.data.setdefault(DATA_DISPATCHER, {}).setdefault(signal, [])
+    targets.append(target)
+
+    def async_remove_dispatcher():
+        """Remove the signal listener."""
+
+        if target in targets:
+            targets.remove(target)
+
+    return async_remove_dispatcher
+
+
+def async_dispatcher_send(hass, signal, *args):
+    """Send a signal, the listeners are called as jobs like Home Assistant does."""
+
+    for target in list(hass.data.get(DATA_DISPATCHER, {}).get(signal, [])):
+        hass.async_add_job(target, *args)
@@ -0,0 +1,78 @@
+"""Stand-in for homeassistant.helpers.entity."""
+
+
+class Entity:
+    """Base class of the entities."""
+
+    hass = None
+    entity_id = None
+
+    @property
+    def should_poll(self):
+        return True
+
+    @property
+    def unique_id(self):
+        return None
+
+    @property
+    def name(self):
+        return None
+
+    @property
+    def state(self):
+        return None
+
+    @property
+    def device_state_attributes(self):
+        return None
+
+    @property
+    def icon(self):
+        return None
+
+    @property
+    def unit_of_measurement(self):
+        return None
+
+    @property
+    def available(self):
+        return True
+
+    @property
+    def device_info(self):
+        return None
+
+    def async_write_ha_state(self):
+        """Write the state of the entity to the state machine."""
+
+        attributes = dict(self.device_state_attributes or {})
+        for key, value in (("friendly_name", self.name), ("icon", self.icon), ("unit_of_measurement", self.unit_of_measurement)):
+            if value is not None:
+                attributes[key] = value
+
+        self.hass.states.async_set(self.entity_id, self.state, attributes)
+
+    async def async_update_ha_state(self, force_refresh=False):
+        """Update the entity if requested, and write its state."""
+
+        if force_refresh:
+            await self.async_device_update()
+        self.async_write_ha_state()
+
+    def async_schedule_update_ha_state(self, force_refresh=False):
+        """Schedule an update of the state of the entity."""
+
+        self.hass.async_create_task(self.async_update_ha_state(force_refresh))
+
+    async def async_device_update(self):
+        """Update the entity, if it has an update method."""
+
+        if hasattr(self, "async_update"):
+            await self.async_update()
+
+    async def async_added_to_hass(self):
+        """Run when the entity is added to Home Assistant."""
+
+    async def async_will_remove_from_hass(self):
+        """Run when the entity will be removed from Home Assistant."""
@@ -0,0 +1,44 @@
+"""Stand-in for homeassistant.helpers.event."""
+
+import homeassistant.util.dt as dt_util
+
+DATA_POINT_IN_TIME_LISTENERS = "point_in_time_listeners"
+
+
+def async_track_point_in_utc_time(hass, action, point_in_time):
+    """Run an action at a point in time, return the function to cancel it. The tests don't
+    wait for the time to pass, the actions are run by async_fire_time_changed."""
+
+    listener = (dt_util.as_utc(point_in_time), action)
+    listeners = hass.data.setdefault(DATA_POINT_IN_TIME_LISTENERS, [])
+    listeners.append(listener)
+
+    def async_remove_listener():
+        """Remove the listener."""
+
+        if listener in listeners:
+            listeners.remove(listener)
+
+    return async_remove_listener
+
+
+def async_track_point_in_time(hass, action, point_in_time):
+    """Run an action at a point in (local) time, return the function to cancel it."""
+
+    return async_track_point_in_utc_time(hass, action, point_in_time)
+
+
+def async_track_time_change(hass, action, hour=None, minute=None, second=None):
+    """Run an action at the matching times. The tests don't run long enough to pass midnight,
+    so the listener is only registered."""
+
+    listeners = hass.data.setdefault("time_change_listeners", [])
+    listeners.append(action)
+
+    def async_remove_listener():
+        """Remove the listener."""
+
+        if action in listeners:
+            listeners.remove(action)
+
+    return async_remove_listener
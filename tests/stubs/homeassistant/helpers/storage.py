@@ -0,0 +1,32 @@
+"""Stand-in for homeassistant.helpers.storage, the data is kept in memory."""
+
+DATA_STORAGE = "storage"
+
+
+class Store:
+    """Persistent storage of a key, kept in hass.data."""
+
+    def __init__(self, hass, version, key):
+
+        self.hass = hass
+        self.version = version
+        self.key = key
+
+    @property
+    def _storage(self):
+        return self.hass.data.setdefault(DATA_STORAGE, {})
+
+    async def async_load(self):
+        """Return the stored data, None if nothing is stored."""
+
+        return self._storage.get(self.key)
+
+    async def async_save(self, data):
+        """Store the data."""
+
+        self._storage[self.key] = data
+
+    def async_delay_save(self, data_func, delay=0):
+        """Store the data returned by data_func. The real Store writes it after the delay."""
+
+        self._storage[self.key] = data_func()
@@ -0,0 +1,63 @@
+"""Stand-in for homeassistant.util.dt, the local time zone is UTC."""
+
+from datetime import (
+    datetime,
+    time,
+    timezone,
+)
+
+UTC = timezone.utc
+DEFAULT_TIME_ZONE = UTC
+
+
+def utcnow():
+    """Return the current time in UTC."""
+    return datetime.now(UTC)
+
+
+def now():
+    """Return the current time in the local time zone."""
+    return datetime.now(DEFAULT_TIME_ZONE)
+
+
+def as_utc(dattim):
+    """Return a datetime as UTC time, naive datetimes are assumed to be in the local time zone."""
+
+    if dattim.tzinfo is None:
+        dattim = dattim.replace(tzinfo=DEFAULT_TIME_ZONE)
+
+    return dattim.astimezone(UTC)
+
+
+def as_local(dattim):
+    """Convert a UTC datetime object to local time zone."""
+
+    if dattim.tzinfo is None:
+        dattim = dattim.replace(tzinfo=UTC)
+
+    return dattim.astimezone(DEFAULT_TIME_ZONE)
+
+
+def utc_from_timestamp(timestamp):
+    """Return a UTC datetime from a timestamp."""
+    return datetime.fromtimestamp(timestamp, UTC)
+
+
+def start_of_local_day(dt_or_d=None):
+    """Return the start of the local day of a date or datetime, default today."""
+
+    if dt_or_d is None:
+        dt_or_d = now().date()
+    elif isinstance(dt_or_d, datetime):
+        dt_or_d = as_local(dt_or_d).date()
+
+    return datetime.combine(dt_or_d, time(), tzinfo=DEFAULT_TIME_ZONE)
+
+
+def parse_datetime(dt_str):
+    """Parse a string and return a datetime, None if it isn't a valid datetime."""
+
+    try:
+        return datetime.fromisoformat(dt_str)
+    except ValueError:
+        return None
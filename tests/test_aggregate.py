@@ -0,0 +1,28 @@
+"""Tests of the fleet-level numbers of the RDW device."""
+
+from datetime import timedelta
+
+import homeassistant.util.dt as dt_util
+
+
+def test_expiry_boundaries(harness):
+    """A car is expired on its expiry date, and expiring during the 30 days after today."""
+
+    from rdw.aggregate import RDWAggregate
+    from rdw.vehicle import RDWVehicle
+
+    today = dt_util.now().date()
+    expdates = {
+        "EXP001": today - timedelta(days=1),
+        "EXP002": today,
+        "EXP003": today + timedelta(days=1),
+        "EXP004": today + timedelta(days=30),
+        "EXP005": today + timedelta(days=31),
+    }
+
+    aggregate = RDWAggregate(harness.hass)
+    for plate, expdate in expdates.items():
+        aggregate.async_update_plate(plate, RDWVehicle("Volkswagen", "Golf", expdate, True))
+
+    assert aggregate.expired == 2
+    assert aggregate.expiring() == 2
@@ -0,0 +1,46 @@
+"""Tests of the refresh cycle at fleet scale, using the benchmark harness."""
+
+import math
+
+import pytest
+
+from .benchmark import ENTRY_COUNTS
+
+
+@pytest.mark.parametrize("count", ENTRY_COUNTS)
+def test_refresh_cycle(harness, count):
+    """A refresh cycle uses batched requests, no executor jobs and one state write per entity."""
+
+    const = harness.const
+    harness.setup(count)
+
+    for result in [harness.refresh() for _ in range(2)]:
+        # One request per chunk of plates to the APK dataset and to the recall dataset
+        assert result.requests == 2 * math.ceil(count / const.RDW_BATCH_SIZE)
+        assert result.executor_jobs == 0
+
+        # The sensors of each car, and the diagnostic sensors of the RDW API. The fleet
+        # sensors aren't written, because none of the cars changed
+        sensors = len(const.SENSOR_DEFAULTS) + len(const.BINARY_SENSOR_DEFAULTS)
+        assert result.state_writes == count * sensors + len(const.RDW_ENDPOINTS)
+
+
+def test_refresh_cycle_outage(harness):
+    """During an outage the circuit breaker stops the requests, and the sensors keep their stale data."""
+
+    const = harness.const
+    harness.setup(10)
+    harness.server.error_rate = 1
+
+    # Each cycle fails at least one request, so the circuit breaker is open in the last cycle
+    results = [harness.refresh() for _ in range(const.RDW_BREAKER_THRESHOLD)]
+
+    # The failed requests are retried, until the circuit breaker opens
+    assert results[0].requests > 0
+    assert results[-1].requests == 0
+
+    states = harness.states("_bm")
+    assert len(states) == 30
+    for state, attributes in states.values():
+        assert state not in (None, "unknown")
+        assert attributes[const.ATTR_STALE] is True
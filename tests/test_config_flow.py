@@ -0,0 +1,71 @@
+"""Tests of the config flow of the integration."""
+
+
+def create_flow(harness):
+    """Return a config flow of the integration, started by the user."""
+
+    from rdw.config_flow import RDWFlowHandler
+
+    flow = RDWFlowHandler()
+    flow.hass = harness.hass
+    flow.context = {"source": "user"}
+
+    return flow
+
+
+def test_single_plate_with_spaces(harness):
+    """A plate with spaces isn't a list of plates, it's handled by the user step."""
+
+    harness.setup(0)
+
+    result = harness.run(create_flow(harness).async_step_user({"plate": " bm 00-01 "}))
+
+    assert result["type"] == "form"
+    assert result["step_id"] == "details"
+    assert harness.hass.config_entries.flow.flows == []
+
+
+def test_bulk_plates(harness):
+    """The registered plates are added, the invalid, unregistered and configured plates are reported."""
+
+    const = harness.const
+    harness.setup(1)
+    harness.server.unregistered.add("BM0003")
+
+    result = harness.run(create_flow(harness).async_step_user({
+        "plate": "BM0001, bm-00-02;BM0003\nBM0000\nBM00\n\nBM 00 01",
+    }))
+    harness.block_till_done()
+
+    assert result["type"] == "abort"
+    assert result["reason"] == "bulk_added"
+    assert result["description_placeholders"] == {
+        "added": "2",
+        "invalid": "BM00, BM0003",
+        "failed": "-",
+        "configured": "BM0000",
+    }
+    assert [(context, data[const.CONF_PLATE]) for _, context, data in harness.hass.config_entries.flow.flows] == [
+        ({"source": const.SOURCE_BULK}, "BM0001"),
+        ({"source": const.SOURCE_BULK}, "BM0002"),
+    ]
+
+
+def test_bulk_plates_connection_error(harness):
+    """Plates which couldn't be looked up are reported, and the form is shown again."""
+
+    harness.setup(1)
+    harness.server.error_rate = 1.0
+
+    result = harness.run(create_flow(harness).async_step_bulk({"plates": "BM0001, BM0000, BM00"}))
+    harness.block_till_done()
+
+    assert result["type"] == "form"
+    assert result["step_id"] == "bulk"
+    assert result["errors"] == {"base": "connection_error"}
+    assert result["description_placeholders"] == {
+        "invalid": "BM00",
+        "failed": "BM0001",
+        "configured": "BM0000",
+    }
+    assert harness.hass.config_entries.flow.flows == []
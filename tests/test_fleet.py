@@ -0,0 +1,42 @@
+"""Tests of the batched data retrieval of the fleet."""
+
+import asyncio
+
+
+def test_refresh_joins_queued_update(harness):
+    """A refresh of a plate which is queued for the next batch joins the batch, instead of fetching it again."""
+
+    const = harness.const
+    entries = harness.setup(1)
+    rdw = harness.entity(entries[0])
+    requests = harness.server.request_count
+
+    async def async_refresh_queued():
+        # The update waits for the batch, the refresh service is called in the meantime
+        update = harness.hass.async_create_task(rdw.async_update())
+        await asyncio.sleep(0)
+        await harness.hass.services.async_call(const.DOMAIN, const.SERVICE_REFRESH, {"plate": rdw.plate})
+        return await update
+
+    assert harness.run(async_refresh_queued())
+    harness.block_till_done()
+
+    # One request to the APK dataset and one to the recall dataset
+    assert harness.server.request_count - requests == 2
+
+
+def test_failed_batch_fails_queued_requests(harness):
+    """The requests which wait for a batch get the error when the batch fails, instead of waiting forever."""
+
+    harness.setup(0)
+    fleet = harness.hass.data[harness.const.DOMAIN][harness.const.DATA_FLEET]
+
+    # Home Assistant raises when the stored data is corrupt
+    async def async_load():
+        raise ValueError("corrupt store")
+
+    fleet.store.async_load = async_load
+
+    result = harness.run(asyncio.wait_for(fleet.async_lookup(["AB12CD"], ["expdate"]), 5))
+
+    assert isinstance(result["AB12CD"], ValueError)
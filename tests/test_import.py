@@ -0,0 +1,91 @@
+"""Tests of the import time of the integration and its config flow."""
+
+import json
+import subprocess
+import sys
+
+from .common import INTEGRATION_PATH
+from . import STUBS_PATH
+
+# Import time of the integration and its config flow, with the Home Assistant modules already loaded
+IMPORT_TIME_BUDGET = 0.1
+
+# Loaded when the first car is refreshed, or when the local RDW index is used
+LAZY_MODULES = [
+    "aiohttp",
+    "rdw.api",
+    "rdw.coordinator",
+    "rdw.fleet",
+    "rdw.index",
+    "rdw.recall",
+    "sqlite3",
+]
+
+# Imports the integration in a new interpreter, and prints the import time and the loaded modules
+IMPORT_SCRIPT = """
+import importlib
+import importlib.util
+import json
+import sys
+from time import perf_counter
+
+sys.path.insert(0, {stubs!r})
+
+# Home Assistant has loaded these modules before it loads the integration
+import voluptuous
+import homeassistant.config_entries
+import homeassistant.const
+import homeassistant.core
+import homeassistant.exceptions
+import homeassistant.helpers.config_validation
+import homeassistant.helpers.dispatcher
+import homeassistant.helpers.entity
+import homeassistant.helpers.event
+import homeassistant.util.dt
+
+start = perf_counter()
+
+spec = importlib.util.spec_from_file_location(
+    "rdw",
+    {path!r} + "/__init__.py",
+    submodule_search_locations=[{path!r}]
+)
+module = importlib.util.module_from_spec(spec)
+sys.modules["rdw"] = module
+spec.loader.exec_module(module)
+importlib.import_module("rdw.config_flow")
+
+print(json.dumps({{"time": perf_counter() - start, "modules": sorted(sys.modules)}}))
+"""
+
+
+def import_integration():
+    """Return the import time and the loaded modules of a fresh import of the integration."""
+
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT.format(stubs=STUBS_PATH, path=INTEGRATION_PATH)],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    return json.loads(result.stdout)
+
+
+def test_lazy_imports():
+    """Loading the integration and opening the config flow doesn't load the data retrieval code."""
+
+    modules = import_integration()["modules"]
+
+    assert "rdw.config_flow" in modules
+    for module in LAZY_MODULES:
+        assert module not in modules
+
+
+def test_import_time():
+    """The integration and its config flow are imported within the import time budget."""
+
+    # The fastest of a few imports, to rule out a busy host
+    import_time = min(import_integration()["time"] for _ in range(3))
+
+    assert import_time < IMPORT_TIME_BUDGET
@@ -0,0 +1,55 @@
+"""Tests of the setup and unload of the config entries, and of the RDW entity."""
+
+from datetime import timedelta
+
+import homeassistant.util.dt as dt_util
+
+from .common import async_fire_time_changed
+
+
+def test_reload_keeps_stale_data_stale(harness):
+    """Reloading a car during an outage keeps its data marked as stale."""
+
+    const = harness.const
+    entries = harness.setup(1)
+    harness.server.error_rate = 1
+    for _ in range(const.RDW_BREAKER_THRESHOLD):
+        harness.refresh()
+
+    before = harness.states("_bm")
+    harness.run(harness.hass.config_entries.async_reload(entries[0].entry_id))
+    harness.block_till_done()
+    after = harness.states("_bm")
+
+    assert len(after) == 3
+    for entity_id, (state, attributes) in after.items():
+        assert attributes[const.ATTR_STALE] is True
+        assert attributes[const.ATTR_LAST_UPDATE] == before[entity_id][1][const.ATTR_LAST_UPDATE]
+
+
+def test_apk_expires_without_update(harness, monkeypatch):
+    """At the start of the expiry date the APK is expired and the event is fired, without retrieving the data."""
+
+    from rdw.vehicle import RDWVehicle
+
+    const = harness.const
+    entries = harness.setup(1)
+    rdw = harness.entity(entries[0])
+
+    tomorrow = dt_util.now().date() + timedelta(days=1)
+    rdw.update_from_vehicle(RDWVehicle("Volkswagen", "Golf", tomorrow, True), dt_util.utcnow())
+    requests = harness.server.request_count
+
+    expiry = dt_util.start_of_local_day(tomorrow)
+    monkeypatch.setattr(dt_util, "now", lambda: expiry)
+    monkeypatch.setattr(dt_util, "utcnow", lambda: expiry)
+    async_fire_time_changed(harness.hass, expiry)
+    harness.block_till_done()
+
+    assert harness.hass.bus.events == [(const.EVENT_APK_EXPIRED, {
+        const.CONF_PLATE: rdw.plate,
+        "name": entries[0].data["name"],
+        "expdate": tomorrow.isoformat(),
+    })]
+    assert harness.states("expdate")["sensor.car_bm0000_expdate"][1][const.ATTR_APK_VALID] is False
+    assert harness.server.request_count == requests
@@ -0,0 +1,17 @@
+"""Tests of the sensors of the RDW device."""
+
+
+def test_domain_sensors_move_to_other_entry(harness):
+    """The fleet and diagnostic sensors of the RDW device stay when the config entry which owns them is removed."""
+
+    const = harness.const
+    harness.setup(2)
+    owner = harness.hass.data[const.DOMAIN][const.DATA_DIAGNOSTICS]
+    before = harness.states("sensor.rdw_")
+
+    harness.run(harness.hass.config_entries.async_remove(owner))
+    harness.block_till_done()
+
+    assert len(before) == len(const.FLEET_SENSOR_TYPES) + len(const.RDW_ENDPOINTS)
+    assert sorted(harness.states("sensor.rdw_")) == sorted(before)
+    assert harness.hass.data[const.DOMAIN][const.DATA_DIAGNOSTICS] != owner
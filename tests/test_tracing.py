@@ -0,0 +1,51 @@
+"""Tests of the tracing of a refresh cycle."""
+
+import asyncio
+
+
+def get_span_names(span):
+    """Return the names of a span and all its children."""
+    return [span["name"]] + [name for child in span["children"] for name in get_span_names(child)]
+
+
+def test_trace_scheduled_refresh(harness):
+    """The trace of a scheduled refresh cycle contains the state writes of the sensors."""
+
+    from rdw.tracing import async_get_tracer
+
+    harness.setup(2)
+    tracer = async_get_tracer(harness.hass)
+    tracer.async_arm()
+
+    harness.refresh()
+
+    names = get_span_names(tracer.last_trace["trace"])
+    assert names[0] == "refresh"
+    assert "fetch" in names
+    assert "http" in names
+    assert names.count("state_write") == 6
+
+
+def test_trace_queued_refresh(harness):
+    """A refresh which joins the queued update of a plate is traced as queueing."""
+
+    from rdw.tracing import async_get_tracer
+
+    const = harness.const
+    entries = harness.setup(1)
+    rdw = harness.entity(entries[0])
+    tracer = async_get_tracer(harness.hass)
+
+    async def async_refresh_queued():
+        update = harness.hass.async_create_task(rdw.async_update())
+        await asyncio.sleep(0)
+        tracer.async_arm()
+        await harness.hass.services.async_call(const.DOMAIN, const.SERVICE_REFRESH, {"plate": rdw.plate})
+        await update
+
+    harness.run(async_refresh_queued())
+    harness.block_till_done()
+
+    names = get_span_names(tracer.last_trace["trace"])
+    assert "queue" in names
+    assert "fetch" not in names